@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+"""This is a support script to benchmark the dataframe engines.
+
+It builds a synthetic DataFrame shaped like the parsed DLTINS data, then times each installed engine
+(see src/app/Engine.py) converting, transforming and serializing it. Each engine output must be
+identical to the pandas output, or the script exits with an error.
+
+Run from project's root directory:
+    `PYTHONPATH=src poetry run python setup/benchmark-engines.py [rows] [csv|parquet]`
+"""
+import sys
+from io import BytesIO
+from random import choices, seed
+from string import ascii_letters, digits
+from time import perf_counter
+
+from pandas import DataFrame, read_parquet
+
+from app.Engine import ENGINES, get_engine
+
+
+def sample(rows: int) -> DataFrame:  # noqa: D103
+    seed(rows)
+    text = ascii_letters + digits + ' ,"'
+    return DataFrame({
+        'Id': [''.join(choices(ascii_letters.upper() + digits, k=12)) for _ in range(rows)],
+        'FullNm': [''.join(choices(text, k=60)) for _ in range(rows)],
+        'ClssfctnTp': ['RFSTCB'] * rows,
+        'CmmdtyDerivInd': ['false'] * rows,
+        'NtnlCcy': ['EUR'] * rows,
+        'Issr': [''.join(choices(ascii_letters.upper() + digits, k=20)) for _ in range(rows)],
+    })
+
+
+def main():  # noqa: D103
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    output_format = sys.argv[2] if len(sys.argv) > 2 else 'csv'
+    df = sample(rows)
+    expected = None
+
+    print(f'{rows} rows, {output_format} output')
+    for name in ENGINES:
+        try:
+            engine = get_engine(name)
+        except ModuleNotFoundError as e:
+            print(f'{name:>8}: skipped ({e})')
+            continue
+
+        started = perf_counter()
+        frame = engine.create_derived_columns(engine.from_pandas(df.copy()))
+        transformed = perf_counter()
+        output = engine.write(frame, output_format)
+        done = perf_counter()
+
+        if output_format == 'parquet':
+            output_csv = read_parquet(BytesIO(output)).to_csv(index=False).encode()
+        else:
+            output_csv = output
+
+        expected = expected or output_csv
+        if output_csv != expected:
+            print(f'\n\t\033[91m{name} output differs from pandas output\033[0m\n', file=sys.stderr)
+            sys.exit(1)
+
+        print('{:>8}: transform {:.3f}s, write {:.3f}s, total {:.3f}s ({} bytes)'.format(
+            name, transformed - started, done - transformed, done - started, len(output),
+        ))
+
+
+if __name__ == '__main__':
+    main()
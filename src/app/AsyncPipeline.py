@@ -0,0 +1,137 @@
+"""AsyncPipeline module
+
+This module runs the application stages as asyncio tasks, with concurrency limits per stage
+"""
+import asyncio
+from concurrent.futures import Executor
+from inspect import iscoroutinefunction
+from time import perf_counter
+
+from .Pipeline import Stage
+
+
+class AsyncPipeline:
+    """The asyncio pipeline runtime
+
+    Each item flows through the stages in order, as an asyncio task. A stage handles at most `workers` items
+    at once: coroutine functions (I/O-bound, i.e. HTTP and storage transfers) are awaited in the event loop,
+    and other functions (CPU-bound, i.e. parsing) run in the `executor`. At most `max_in_flight` items are
+    in the pipeline at once. A failed item is logged and dropped, without stopping the other items.
+    An `ordered` stage handles the items in the order they were fed.
+
+    Stage functions return the next item, or None to drop it (generators are not supported).
+
+    Examples:
+        > asyncio.run(AsyncPipeline([Stage('fetch', fetch, workers=8), Stage('parse', parse)]).run(urls))
+    """
+
+    def __init__(self, stages: list, max_in_flight: int = 8, executor: Executor = None, log=None):
+        """Initialize an AsyncPipeline
+
+        Args:
+            stages (list): The Stage objects, in order
+            max_in_flight (int, optional): Maximum items in the pipeline at once (backpressure to the items feed)
+            executor (Executor, optional): The executor for non-coroutine functions. Defaults to the loop's.
+            log (logging.Logger, optional): The logger to report to
+        """
+        self.stages = stages
+        self.max_in_flight = max(1, max_in_flight)
+        self.executor = executor
+        self.log = log
+
+        self.errors = []
+        self.metrics = {}
+
+    async def run(self, items) -> list:
+        """Run the items through all the stages, and wait for them to finish
+
+        Args:
+            items (iterable): The items to feed the first stage with. Consumed lazily.
+
+        Returns:
+            (list): The items returned by the last stage, in completion order
+        """
+        self.errors = []
+        self.metrics = {
+            stage.name: {'running': 0, 'max_running': 0, 'processed': 0, 'failed': 0, 'busy_seconds': 0.0}
+            for stage in self.stages
+        }
+
+        limits = {stage.name: asyncio.Semaphore(stage.workers) for stage in self.stages}
+        turns = {stage.name: ([0], asyncio.Condition()) for stage in self.stages if stage.ordered}
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        results = []
+        tasks = []
+
+        try:
+            for seq, item in enumerate(items):
+                await in_flight.acquire()
+                tasks.append(asyncio.create_task(self._flow(seq, item, limits, turns, in_flight, results)))
+
+        finally:
+            await asyncio.gather(*tasks)
+
+        if self.log:
+            for name, metrics in self.metrics.items():
+                self.log.debug(f'Stage {name}: {metrics}')
+
+        return results
+
+    async def _flow(self, seq: int, item, limits: dict, turns: dict, in_flight: asyncio.Semaphore, results: list):
+        """Run an item through all the stages. A dropped item still takes its turn in the ordered stages."""
+        try:
+            for stage in self.stages:
+                if not stage.ordered:
+                    if item is not None:
+                        item = await self._handle(stage, item, limits[stage.name])
+                    continue
+
+                turn, condition = turns[stage.name]
+                async with condition:
+                    await condition.wait_for(lambda: turn[0] == seq)
+
+                try:
+                    if item is not None:
+                        item = await self._handle(stage, item, limits[stage.name])
+
+                finally:
+                    async with condition:
+                        turn[0] += 1
+                        condition.notify_all()
+
+            if item is not None:
+                results.append(item)
+
+        finally:
+            in_flight.release()
+
+    async def _handle(self, stage: Stage, item, limit: asyncio.Semaphore):
+        """Handle one item in a stage, within its concurrency limit
+
+        Returns:
+            The next item, or None if dropped or failed
+        """
+        async with limit:
+            metrics = self.metrics[stage.name]
+            metrics['running'] += 1
+            metrics['max_running'] = max(metrics['max_running'], metrics['running'])
+            started = perf_counter()
+
+            try:
+                if iscoroutinefunction(stage.func):
+                    return await stage.func(item)
+
+                return await asyncio.get_running_loop().run_in_executor(self.executor, stage.func, item)
+
+            except Exception as e:
+                metrics['failed'] += 1
+                self.errors.append((stage.name, item, e))
+
+                if self.log:
+                    self.log.error(f'Stage {stage.name} failed for an item. See logs for details.')
+                    self.log.debug(e)
+
+            finally:
+                metrics['running'] -= 1
+                metrics['processed'] += 1
+                metrics['busy_seconds'] += perf_counter() - started
@@ -0,0 +1,337 @@
+"""Compactor module
+
+This module merges the files stored by each run into daily or monthly files, and expires old files
+"""
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as _dt, timedelta
+from io import BytesIO
+from uuid import uuid4
+
+import numpy as np
+from pandas import read_csv, read_parquet
+from pandas.core.frame import DataFrame
+from fsspec.implementations.local import LocalFileSystem as LocalFS
+from adlfs.spec import AzureBlobFileSystem as AzureFS
+from s3fs.core import S3FileSystem as S3FS
+
+from .Deduplicator import Deduplicator
+from .Index import Index
+from .Storage import Storage
+
+_RUN_FILE = re.compile(r'^data\.(\d{8})-(\d{4})(?:\.(\d+))?Z\.(csv|parquet)$')
+_COMPACTED_FILE = re.compile(r'^data\.(\d{6}|\d{8})Z\.(csv|parquet)$')
+
+
+class Compactor:
+    """The compaction and retention job
+
+    Files stored by each run (`data.20241024-1537Z.csv`) are merged into a file per day (`data.20241024Z.csv`)
+    or per month (`data.202410Z.csv`), in their own format, on every storage. Monthly compaction also
+    merges the daily files. A period is only compacted once it is over for `grace_hours`, so that runs still
+    uploading are never raced; a file arriving later is merged into the existing compacted file next time.
+
+    Source files are read in parallel, newest first, and streamed into the compacted file one at a time,
+    keeping the latest record of each Id. The compacted file and its sidecar index are written under a
+    temporary name, then moved in place, before the source files are removed.
+
+    Run a single compaction job at a time.
+
+    Examples:
+        > Compactor(storage, period='monthly', retention_days=365).run()
+    """
+
+    PERIODS = {'daily': 8, 'monthly': 6}
+    ROW_GROUP_ROWS = 64 * 1024
+
+    def __init__(
+            self,
+            storage: Storage,
+            period: str = 'daily',
+            grace_hours: float = 6,
+            retention_days: float = 0,
+            read_workers: int = 4,
+            dedup: bool = True,
+            log=None,
+    ):
+        """Initialize the Compactor
+
+        Args:
+            storage (Storage): The connected storages to compact
+            period (str, optional): One of 'daily' or 'monthly'
+            grace_hours (float, optional): Hours to wait after a period is over before compacting it
+            retention_days (float, optional): Remove the files of periods over for longer than this. 0 disables it.
+            read_workers (int, optional): Source files to read in parallel
+            dedup (bool, optional): Keep only the latest record of each Id in a compacted file
+            log (logging.Logger, optional): The logger to report to
+
+        Raises:
+            ValueError: For an unknown period
+        """
+        if period not in self.PERIODS:
+            raise ValueError(f'Compaction period not recognized: {period!r}. Use one of {", ".join(self.PERIODS)}.')
+
+        self.storage = storage
+        self.period = period
+        self.grace = timedelta(hours=grace_hours)
+        self.retention = timedelta(days=retention_days) if retention_days else None
+        self.read_workers = max(1, read_workers)
+        self.dedup = dedup
+        self.log = log
+
+    def run(self, now: _dt = None) -> dict:
+        """Compact and expire the files of every storage
+
+        Args:
+            now (datetime, optional): The current UTC time. Defaults to now.
+
+        Returns:
+            (dict): The counts of `compacted` files written, source files `merged` into them, and files `expired`
+        """
+        now = now or _dt.utcnow()
+        totals = {'compacted': 0, 'merged': 0, 'expired': 0}
+
+        for fs, location in self.storage.file_systems:
+            for target, sources in self.plan(self.list_files(fs, location), now).items():
+                self.compact(fs, location, target, sources)
+                totals['compacted'] += 1
+                totals['merged'] += len(sources)
+
+            if self.retention:
+                totals['expired'] += len(self.expire(fs, location, self.list_files(fs, location), now))
+
+        return totals
+
+    @staticmethod
+    def list_files(fs: (LocalFS, AzureFS, S3FS), location: str) -> list:
+        """List the names of the run and compacted files in a storage location"""
+        names = (path.rsplit('/', 1)[-1] for path in fs.glob(f'{location}/data.*'))
+        return sorted(name for name in names if _RUN_FILE.match(name) or _COMPACTED_FILE.match(name))
+
+    @staticmethod
+    def run_file_name(timestamp: str, part: int, output_format: str) -> str:
+        """Name of a file stored by a run (i.e. data.20241024-1537Z.csv, or data.20241024-1537.1Z.csv for part 1)
+
+        Args:
+            timestamp (str): The run UTC time, as YYYYmmdd-HHMM
+            part (int): The package position in the run, newest first
+            output_format (str): One of 'csv' or 'parquet'
+        """
+        return 'data.{}Z.{}'.format(timestamp if part == 0 else f'{timestamp}.{part}', output_format)
+
+    @staticmethod
+    def file_order(name: str) -> tuple:
+        """Sort key of a stored file, by age: its run timestamp and package part, or its compacted period
+
+        Compacted files sort before the run files of their period, and the first part of a run is its newest package.
+        """
+        found = _RUN_FILE.match(name)
+        if found:
+            return found.group(1) + found.group(2), -int(found.group(3) or 0)
+
+        return _COMPACTED_FILE.match(name).group(1), 0
+
+    @staticmethod
+    def period_end(key: str) -> _dt:
+        """End of a daily (YYYYmmdd) or monthly (YYYYmm) period"""
+        if len(key) == 8:
+            return _dt.strptime(key, '%Y%m%d') + timedelta(days=1)
+
+        start = _dt.strptime(key, '%Y%m')
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def plan(self, names: list, now: _dt) -> dict:
+        """Group the files to compact by target file
+
+        Args:
+            names (list): The stored file names
+            now (datetime): The current UTC time
+
+        Returns:
+            (dict): The source file names of each target file name, newest first
+        """
+        length = self.PERIODS[self.period]
+        groups = {}
+
+        for name in names:
+            stamp, output_format = self.file_order(name)[0], name.rsplit('.', 1)[1]
+            if len(stamp) < length:
+                continue  # A monthly file is never merged into a daily one
+
+            target = f'data.{stamp[:length]}Z.{output_format}'
+            groups.setdefault(target, []).append(name)
+
+        return {
+            target: sorted(sources, key=self.file_order, reverse=True)
+            for target, sources in groups.items()
+            if sources != [target] and self.period_end(target[5:5 + length]) + self.grace <= now
+        }
+
+    def compact(self, fs: (LocalFS, AzureFS, S3FS), location: str, target: str, sources: list) -> int:
+        """Merge source files into a target file, with its sidecar index, then remove the sources
+
+        Args:
+            fs (LocalFS, AzureFS, S3FS): The file system
+            location (str): The directory, Container or Bucket name
+            target (str): The compacted file name. It may be one of the sources.
+            sources (list): The file names to merge, newest first
+
+        Returns:
+            (int): The records in the compacted file
+        """
+        output_format = target.rsplit('.', 1)[1]
+        target_path = f'{location}/{target}'
+        temp_path = f'{location}/.{target}.{uuid4().hex}.tmp'
+        temp_index_path = f'{location}/.{target}{Index.SUFFIX}.{uuid4().hex}.tmp'
+        deduplicator = Deduplicator() if self.dedup else None
+        ids, offsets, lengths = [], [], []
+        header_length = written = groups = records = duplicates = 0
+        writer = None
+
+        try:
+            with fs.open(temp_path, 'wb') as f:
+                for df in self._read(fs, [f'{location}/{name}' for name in sources], output_format):
+                    if deduplicator is not None:
+                        kept = deduplicator.deduplicate(df)
+                        duplicates += len(df) - len(kept)
+                        df = kept
+
+                    ids.append(df['Id'].to_numpy())
+                    records += len(df)
+
+                    if output_format == 'parquet':
+                        writer, written_groups = self._write_parquet(f, writer, df)
+                        rows = np.arange(len(df))
+                        offsets.append(groups + rows // self.ROW_GROUP_ROWS)
+                        lengths.append(rows % self.ROW_GROUP_ROWS)
+                        groups += written_groups
+                        continue
+
+                    data = df.to_csv(index=False).encode()
+                    ends = Index.csv_row_ends(data).astype(np.int64)
+                    shift = 0 if written == 0 else written - ends[0]  # The header is only written once
+                    header_length = header_length or int(ends[0])
+
+                    f.write(data if written == 0 else data[ends[0]:])
+                    written += len(data) if written == 0 else len(data) - int(ends[0])
+                    offsets.append(ends[:-1] + shift)
+                    lengths.append(ends[1:] - ends[:-1])
+
+                if writer is not None:
+                    writer.close()
+
+            if self.storage.index:
+                index = Index.pack(
+                    np.concatenate(ids), np.concatenate(offsets), np.concatenate(lengths), header_length=header_length,
+                )
+                fs.pipe_file(temp_index_path, index)
+
+            # A previous sidecar indexes the previous target file: remove it before the target is replaced,
+            # so lookups never read the new file with the previous offsets (they skip it until indexed again)
+            if fs.exists(target_path + Index.SUFFIX):
+                fs.rm(target_path + Index.SUFFIX)
+
+            fs.mv(temp_path, target_path)
+
+            if self.storage.index:
+                fs.mv(temp_index_path, target_path + Index.SUFFIX)
+
+        finally:
+            for path in (temp_path, temp_index_path):
+                if fs.exists(path):
+                    fs.rm(path)
+
+            if deduplicator is not None:
+                deduplicator.close()
+
+        for name in sources:
+            if name != target:
+                self._remove(fs, f'{location}/{name}')
+
+        if self.log:
+            self.log.info('Compacted {} file(s) into {} ({} records{})'.format(
+                len(sources), target_path, records,
+                f', {duplicates} duplicate record(s) dropped' if duplicates else '',
+            ))
+
+        return records
+
+    def expire(self, fs: (LocalFS, AzureFS, S3FS), location: str, names: list, now: _dt) -> list:
+        """Remove the files, and their sidecar indexes, of the periods over for longer than the retention
+
+        Args:
+            fs (LocalFS, AzureFS, S3FS): The file system
+            location (str): The directory, Container or Bucket name
+            names (list): The stored file names
+            now (datetime): The current UTC time
+
+        Returns:
+            (list): The removed file paths
+        """
+        removed = []
+
+        for name in names:
+            stamp = self.file_order(name)[0]
+            if self.period_end(stamp[:8]) + self.retention <= now:
+                self._remove(fs, f'{location}/{name}')
+                removed.append(f'{location}/{name}')
+
+        if removed and self.log:
+            self.log.info(f'Expired {len(removed)} file(s) from {location}')
+
+        return removed
+
+    def _read(self, fs: (LocalFS, AzureFS, S3FS), paths: list, output_format: str):
+        """Read files in parallel, yielding them in order, with at most `read_workers` files ahead"""
+        with ThreadPoolExecutor(max_workers=self.read_workers) as executor:
+            pending = deque()
+
+            for path in paths:
+                pending.append(executor.submit(self._read_file, fs, path, output_format))
+                if len(pending) > self.read_workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    @staticmethod
+    def _read_file(fs: (LocalFS, AzureFS, S3FS), path: str, output_format: str) -> DataFrame:
+        """Read a stored file. CSV values are read as text, to write them back unchanged."""
+        data = BytesIO(fs.cat_file(path))
+
+        if output_format == 'parquet':
+            return read_parquet(data)
+
+        return read_csv(data, dtype=str, keep_default_na=False)
+
+    def _write_parquet(self, f, writer, df: DataFrame) -> tuple:
+        """Append a DataFrame to a Parquet file, in row groups of `ROW_GROUP_ROWS` rows
+
+        Returns:
+            (tuple): The ParquetWriter, and the count of row groups written
+        """
+        # Optional dependency, required to write Parquet (the `parquet` extra)
+        import pyarrow
+        from pyarrow.parquet import ParquetWriter
+
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+
+        if writer is None:
+            writer = ParquetWriter(f, table.schema)
+        else:
+            table = table.cast(writer.schema)
+
+        if not len(table):
+            return writer, 0
+
+        writer.write_table(table, row_group_size=self.ROW_GROUP_ROWS)
+        return writer, -(-len(table) // self.ROW_GROUP_ROWS)
+
+    @staticmethod
+    def _remove(fs: (LocalFS, AzureFS, S3FS), path: str):
+        """Remove a stored file and its sidecar index, if any (first, so it never points to a missing file)"""
+        if fs.exists(path + Index.SUFFIX):
+            fs.rm(path + Index.SUFFIX)
+
+        fs.rm(path)
@@ -0,0 +1,145 @@
+"""Daemon module
+
+This module keeps the application running, polling for new packages and handling them
+"""
+import signal
+from json import dump, load
+from os import replace
+from pathlib import Path
+from random import uniform
+from tempfile import mkstemp
+from threading import Event
+
+
+class Daemon:
+    """The long-running poller
+
+    This class polls for package keys on an interval (with jitter, and backoff on failures), and runs
+    a handler with the keys not seen before. Handled keys are kept in a state file to survive restarts.
+    SIGTERM and SIGINT only request a stop: an in-flight run is never interrupted, and a handler can
+    check `stopping` to take no more keys.
+
+    Examples:
+        > Daemon(poll=lambda: ['a', 'b'], run=lambda keys: keys, interval=60).serve()
+    """
+
+    def __init__(
+            self,
+            poll: callable,
+            run: callable,
+            interval: float = 900,
+            jitter: float = 0,
+            max_backoff: float = 3600,
+            state_file: (str, Path) = None,
+            log=None,
+    ):
+        """Initialize the Daemon
+
+        Args:
+            poll (callable): Returns the list of package keys currently available
+            run (callable): Handles a list of new package keys, returning the ones handled successfully
+            interval (float, optional): Seconds between polls
+            jitter (float, optional): Maximum random seconds added to every wait
+            max_backoff (float, optional): Maximum seconds to wait after consecutive failures
+            state_file (str, Path, optional): JSON file to remember handled keys between restarts
+            log (logging.Logger, optional): The logger to report to
+        """
+        self.poll = poll
+        self.run = run
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.state_file = Path(state_file) if state_file else None
+        self.log = log
+
+        self.failures = 0
+        self.seen = self._load_state()
+        self._stop = Event()
+
+    @property
+    def stopping(self) -> bool:
+        """Whether a stop was requested"""
+        return self._stop.is_set()
+
+    def stop(self, *_):
+        """Request the loop to stop, once the current run (if any) returns"""
+        if self.log and not self.stopping:
+            self.log.info('Stop requested, finishing in-flight work')
+
+        self._stop.set()
+
+    def next_delay(self) -> float:
+        """Seconds to wait before the next poll, doubling on each consecutive failure"""
+        delay = min(self.interval * (2 ** self.failures), max(self.interval, self.max_backoff))
+        return delay + uniform(0, self.jitter)
+
+    def serve(self):
+        """Poll and handle new packages until a stop is requested"""
+        handlers = {s: signal.signal(s, self.stop) for s in (signal.SIGTERM, signal.SIGINT)}
+
+        try:
+            while not self.stopping:
+                self.tick()
+                self._stop.wait(self.next_delay())
+
+        finally:
+            for s, handler in handlers.items():
+                signal.signal(s, handler)
+
+    def tick(self):
+        """Poll once and handle the package keys not seen before"""
+        try:
+            keys = [key for key in self.poll() if key not in self.seen]
+            if keys:
+                handled = list(self.run(keys))
+                self.seen.update(handled)
+                self._save_state()
+
+                if len(handled) < len(keys) and not self.stopping:
+                    raise RuntimeError(f'{len(keys) - len(handled)} of {len(keys)} package(s) not handled')
+
+        except Exception as e:
+            self.failures += 1
+            if self.log:
+                self.log.error(f'Poll failed ({self.failures} in a row). See logs for details.')
+                self.log.debug(e)
+            return
+
+        self.failures = 0
+
+    def _load_state(self) -> set:
+        """Load the handled keys from the state file, if any"""
+        if not self.state_file or not self.state_file.is_file():
+            return set()
+
+        try:
+            with open(self.state_file) as f:
+                return set(load(f))
+        except (OSError, ValueError, TypeError):
+            return set()
+
+    def _save_state(self):
+        """Atomically write the handled keys to the state file, if set
+
+        Each write has its own temporary file, so concurrent processes never replace each other's. A failed
+        write is reported, not raised: the keys stay handled in this process.
+        """
+        if not self.state_file:
+            return
+
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_file = mkstemp(dir=self.state_file.parent, prefix=f'.{self.state_file.name}.', suffix='.tmp')
+
+            try:
+                with open(fd, 'w') as f:
+                    dump(sorted(self.seen), f)
+
+                replace(temp_file, self.state_file)
+
+            finally:
+                Path(temp_file).unlink(missing_ok=True)
+
+        except OSError as e:
+            if self.log:
+                self.log.warning(f'Could not save the handled packages to {self.state_file}: {e}')
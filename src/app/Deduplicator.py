@@ -0,0 +1,142 @@
+"""Deduplicator module
+
+This module drops the records of instruments already seen, across files
+"""
+import re
+from pathlib import Path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+import numpy as np
+from pandas import Series
+from pandas.core.frame import DataFrame
+from pandas.util import hash_array
+
+_PACKAGE_ORDER = re.compile(r'_(\d{8})_(\d+)of\d+')
+
+
+class Deduplicator:
+    """The cross-file deduplicator, keyed on the instrument Id
+
+    This class keeps a compact index of the Ids already handled: 64-bit hashes in sorted arrays, searched
+    with numpy. When the in-memory array exceeds `max_memory_keys`, it is spilled to a memory-mapped file.
+    It costs 8 bytes per key, at a ~1e-4 chance of one hash collision in 50 million keys.
+
+    Last writer wins: packages must be handled newest first (see `package_order`), so a record is kept
+    only if no newer package, and no later record in the same package, has the same Id.
+
+    Examples:
+        > dedup = Deduplicator()
+        > dfs = [dedup.deduplicate(df) for df in dfs_newest_first]
+    """
+
+    def __init__(self, column: str = 'Id', max_memory_keys: int = 10_000_000, spill_dir: (str, Path) = None):
+        """Initialize the Deduplicator
+
+        Args:
+            column (str, optional): The column to deduplicate on
+            max_memory_keys (int, optional): Keys to keep in memory before spilling them to disk
+            spill_dir (str, Path, optional): Directory for the spilled keys. Defaults to a temporary directory.
+        """
+        self.column = column
+        self.max_memory_keys = max_memory_keys
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+
+        self._memory = np.empty(0, dtype=np.uint64)
+        self._spilled = []
+        self._temp_dir = None
+
+    def __len__(self) -> int:
+        return len(self._memory) + sum(len(keys) for keys in self._spilled)
+
+    def close(self):
+        """Drop the index, and remove the spilled keys from disk"""
+        self._memory = np.empty(0, dtype=np.uint64)
+        spilled, self._spilled = self._spilled, []
+
+        for keys in spilled:
+            Path(keys.filename).unlink(missing_ok=True)
+
+        if self._temp_dir is not None:
+            rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+
+    @staticmethod
+    def package_order(package_url: str) -> tuple:
+        """Sort key of a DLTINS package: its publication date and part number (i.e. DLTINS_20210119_01of02.zip)
+
+        Args:
+            package_url (str): The package URL or file name
+
+        Returns:
+            (tuple): (date, part). Packages not named as DLTINS sort first, as ('', 0).
+        """
+        found = _PACKAGE_ORDER.search(Path(package_url).name)
+        return (found.group(1), int(found.group(2))) if found else ('', 0)
+
+    def hash(self, values) -> np.ndarray:
+        """Hash key values to 64 bits"""
+        return hash_array(np.asarray(values, dtype=object))
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Check which hashed keys are in the index
+
+        Args:
+            hashes (ndarray): 64-bit hashes of the keys (see `hash`)
+
+        Returns:
+            (ndarray): A boolean mask
+        """
+        found = np.zeros(len(hashes), dtype=bool)
+
+        for keys in (self._memory, *self._spilled):
+            if len(keys):
+                positions = np.searchsorted(keys, hashes)
+                found |= keys[np.minimum(positions, len(keys) - 1)] == hashes
+
+        return found
+
+    def add(self, hashes: np.ndarray):
+        """Add hashed keys to the index, spilling it to disk if too large"""
+        self._memory = np.union1d(self._memory, hashes.astype(np.uint64, copy=False))
+
+        if len(self._memory) > self.max_memory_keys:
+            if self.spill_dir is None and self._temp_dir is None:
+                self._temp_dir = Path(mkdtemp(prefix='dedup-'))
+
+            directory = self.spill_dir or self._temp_dir
+            directory.mkdir(parents=True, exist_ok=True)
+
+            file_path = directory / f'keys.{id(self)}.{len(self._spilled)}.npy'
+            np.save(file_path, self._memory)
+            self._spilled.append(np.load(file_path, mmap_mode='r'))
+            self._memory = np.empty(0, dtype=np.uint64)
+
+    def deduplicate(self, df: DataFrame) -> DataFrame:
+        """Keep the records with Ids not seen before, and the last record of each Id in this DataFrame
+
+        Args:
+            df (DataFrame): The records, from a package newer than the ones already handled
+
+        Returns:
+            DataFrame: The kept records, in their original order
+        """
+        hashes = self.hash(df[self.column])
+        keep = ~Series(hashes).duplicated(keep='last').to_numpy() & ~self.contains(hashes)
+        self.add(hashes[keep])
+
+        return df[keep].reset_index(drop=True)
+
+    def dedup(self, package: dict) -> dict:
+        """Deduplicate a parsed package (pipeline stage, ordered)
+
+        Args:
+            package (dict): Having the parsed pandas `df` DataFrame
+
+        Returns:
+            (dict): The package, with the kept records in its `df`, and the dropped count as `duplicates`
+        """
+        df = package['df']
+        package['df'] = self.deduplicate(df)
+        package['duplicates'] = len(df) - len(package['df'])
+        return package
@@ -0,0 +1,349 @@
+"""Downloader module
+
+This module downloads the source packages, resuming interrupted transfers
+"""
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from os import replace
+from pathlib import Path
+from tempfile import gettempdir
+from urllib.parse import urlparse
+
+import aiohttp
+import fsspec
+import requests
+from requests.exceptions import ConnectionError, ChunkedEncodingError, HTTPError, Timeout
+
+CHECKSUM_ALGORITHMS = {32: 'md5', 40: 'sha1', 64: 'sha256'}
+TRANSIENT_ERRORS = (ConnectionError, ChunkedEncodingError, Timeout)
+ASYNC_TRANSIENT_ERRORS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+
+class Downloader:
+    """The resumable downloader
+
+    This class downloads a file into `<name>.part` and, after a dropped connection, resumes it with
+    HTTP Range requests. Large files can be fetched as several byte ranges in parallel (`parts`), if the
+    server accepts ranges. The final file is verified against the checksum (MD5 for the ESMA register).
+    `download_async` fetches the byte ranges as coroutines instead, on an asyncio HTTP session.
+    Other fsspec URLs (i.e. s3://, az://) are copied with their file system.
+
+    Examples:
+        > path = Downloader(download_dir='/tmp/downloads').download(url, checksum='852b2dde71cf114289ad95ada2a4e406')
+    """
+
+    def __init__(
+            self,
+            session: requests.Session = None,
+            download_dir: (str, Path) = None,
+            retries: int = 5,
+            parts: int = 1,
+            min_part_mb: float = 8,
+            timeout: float = 60,
+    ):
+        """Initialize the Downloader
+
+        Args:
+            session (requests.Session, optional): A session to keep HTTP connections open between requests
+            download_dir (str, Path, optional): Directory for the downloaded (and partial) files
+            retries (int, optional): Attempts to resume a transfer after a transient error
+            parts (int, optional): Maximum parallel byte ranges per file
+            min_part_mb (float, optional): Minimum size of each parallel byte range
+            timeout (float, optional): Seconds to wait for the server on connect and on each read
+        """
+        self.http = session or requests
+        self.download_dir = Path(download_dir or f'{gettempdir()}/downloads')
+        self.retries = retries
+        self.parts = max(1, parts)
+        self.min_part_bytes = int(1024 * 1024 * min_part_mb)
+        self.timeout = timeout
+        self.chunk_bytes = 64 * 1024
+        self.write_buffer_bytes = 16 * self.chunk_bytes
+
+    def download(self, url: str, checksum: str = None) -> Path:
+        """Download a file, resuming from where a previous attempt stopped
+
+        Args:
+            url (str): The HTTP or fsspec URL to download
+            checksum (str, optional): The expected hex digest of the file (MD5, SHA1 or SHA256, by length)
+
+        Returns:
+            (Path): The local path to the verified file
+
+        Raises:
+            requests.exceptions.RequestException: For non-transient errors, or after all retries
+            ValueError: For a checksum mismatch (the partial data is discarded)
+        """
+        file_path = self._file_path(url)
+
+        if file_path.is_file() and checksum and self.verify(file_path, checksum):
+            return file_path
+
+        if urlparse(url).scheme not in ('http', 'https'):
+            return self._finish(url, file_path, self._copy(url, file_path), checksum)
+
+        ranges = self._ranges(self._fetch_size(url) if self.parts > 1 else None)
+
+        if ranges:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                part_paths = list(executor.map(
+                    lambda r: self._fetch_range(url, file_path.with_name(f'{file_path.name}.part{r[0]}'), *r[1:]),
+                    ranges,
+                ))
+            part_path = self._join(file_path, part_paths)
+
+        else:
+            part_path = self._fetch_range(url, file_path.with_name(f'{file_path.name}.part'))
+
+        return self._finish(url, file_path, part_path, checksum)
+
+    async def download_async(self, http: aiohttp.ClientSession, url: str, checksum: str = None) -> Path:
+        """Download a file with an asyncio HTTP session, with the byte ranges fetched concurrently (see `download`)
+
+        Args:
+            http (aiohttp.ClientSession): The asyncio HTTP session. Its connector limits the connections per host.
+            url (str): The URL to download
+            checksum (str, optional): The expected hex digest of the file (MD5, SHA1 or SHA256, by length)
+
+        Returns:
+            (Path): The local path to the verified file
+
+        Raises:
+            aiohttp.ClientError: For non-transient errors, or after all retries
+            ValueError: For a checksum mismatch (the partial data is discarded)
+        """
+        if urlparse(url).scheme not in ('http', 'https'):
+            return await asyncio.to_thread(self.download, url, checksum)
+
+        file_path = self._file_path(url)
+
+        if file_path.is_file() and checksum and await asyncio.to_thread(self.verify, file_path, checksum):
+            return file_path
+
+        ranges = self._ranges(await self._fetch_size_async(http, url) if self.parts > 1 else None)
+
+        if ranges:
+            part_paths = await asyncio.gather(*(
+                self._fetch_range_async(http, url, file_path.with_name(f'{file_path.name}.part{i}'), start, end)
+                for i, start, end in ranges
+            ))
+            part_path = await asyncio.to_thread(self._join, file_path, part_paths)
+
+        else:
+            part_path = await self._fetch_range_async(http, url, file_path.with_name(f'{file_path.name}.part'))
+
+        return await asyncio.to_thread(self._finish, url, file_path, part_path, checksum)
+
+    def _file_path(self, url: str) -> Path:
+        """The local path to download a URL to"""
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+        return self.download_dir / (Path(urlparse(url).path).name or 'download')
+
+    def _ranges(self, size: (None, int)) -> list:
+        """Split a file size in parallel byte ranges, as (part, first byte, last byte). Empty for a single range."""
+        parts = min(self.parts, size // self.min_part_bytes) if size else 1
+        if parts < 2:
+            return []
+
+        step = -(-size // parts)
+        return [(i, start, min(start + step, size) - 1) for i, start in enumerate(range(0, size, step))]
+
+    def _join(self, file_path: Path, part_paths: list) -> Path:
+        """Concatenate the completed byte ranges into the partial file"""
+        part_path = file_path.with_name(f'{file_path.name}.part')
+
+        with open(part_path, 'wb') as f:
+            for path in part_paths:
+                with open(path, 'rb') as p:
+                    while chunk := p.read(self.chunk_bytes):
+                        f.write(chunk)
+
+        for path in part_paths:
+            path.unlink()
+
+        return part_path
+
+    def _finish(self, url: str, file_path: Path, part_path: Path, checksum: str = None) -> Path:
+        """Verify the completed partial file, and move it in place"""
+        if checksum and not self.verify(part_path, checksum):
+            part_path.unlink()
+            raise ValueError(f'Checksum mismatch for {url!r}: expected {checksum}')
+
+        replace(part_path, file_path)
+        return file_path
+
+    @staticmethod
+    def _copy(url: str, file_path: Path) -> Path:
+        """Copy a file from a fsspec URL (i.e. s3://bucket/DLTINS_20210117_01of01.zip) into the partial file"""
+        part_path = file_path.with_name(f'{file_path.name}.part')
+        fs, path = fsspec.core.url_to_fs(url)
+        fs.get_file(path, str(part_path))
+        return part_path
+
+    def _fetch_size(self, url: str) -> (None, int):
+        """Fetch the size of a remote file, if the server accepts byte ranges"""
+        res = self.http.head(url, allow_redirects=True, timeout=self.timeout)
+        res.raise_for_status()
+
+        if res.headers.get('Accept-Ranges') != 'bytes' or 'Content-Length' not in res.headers:
+            return
+
+        return int(res.headers['Content-Length'])
+
+    def _fetch_range(self, url: str, part_path: Path, start: int = 0, end: int = None) -> Path:
+        """Fetch a byte range into a partial file, resuming it after transient errors
+
+        Args:
+            url (str): The URL to download
+            part_path (Path): The partial file, appended to from its current size
+            start (int, optional): First byte of the range
+            end (int, optional): Last byte of the range (inclusive). Defaults to the end of the file.
+
+        Returns:
+            (Path): The completed partial file
+        """
+        failures = 0
+        reached = part_path.stat().st_size if part_path.exists() else 0
+
+        while True:
+            offset = start + (part_path.stat().st_size if part_path.exists() else 0)
+            if end is not None and offset > end:
+                return part_path
+
+            received = 0
+            headers = {}
+            if offset or end is not None:
+                headers['Range'] = 'bytes={}-{}'.format(offset, '' if end is None else end)
+
+            try:
+                with self.http.get(url, headers=headers, stream=True, timeout=self.timeout) as res:
+                    if res.status_code == 416 and end is None:  # Nothing left after offset
+                        return part_path
+
+                    res.raise_for_status()
+
+                    mode = 'ab'
+                    if headers and res.status_code != 206:
+                        if start or end is not None:
+                            raise HTTPError(f'Byte ranges not accepted for {url!r}', response=res)
+                        mode = 'wb'  # The server ignored the Range header: start over
+
+                    expected = res.headers.get('Content-Length')
+
+                    with open(part_path, mode) as f:
+                        for chunk in res.iter_content(chunk_size=self.chunk_bytes):
+                            f.write(chunk)
+                            received += len(chunk)
+
+                    if expected is not None and received < int(expected):
+                        raise ChunkedEncodingError(f'Connection dropped after {received} of {expected} bytes')
+
+                return part_path
+
+            except TRANSIENT_ERRORS:
+                # Only attempts that moved the partial file past its furthest end reset the failures
+                # (a server ignoring the Range header restarts it from the first byte)
+                size = part_path.stat().st_size if part_path.exists() else 0
+                failures, reached = (0, size) if size > reached else (failures + 1, reached)
+                if failures > self.retries:
+                    raise
+
+    async def _fetch_size_async(self, http: aiohttp.ClientSession, url: str) -> (None, int):
+        """Fetch the size of a remote file, if the server accepts byte ranges (see `_fetch_size`)"""
+        async with http.head(url, allow_redirects=True, timeout=self._timeout_async) as res:
+            res.raise_for_status()
+
+            if res.headers.get('Accept-Ranges') != 'bytes' or 'Content-Length' not in res.headers:
+                return
+
+            return int(res.headers['Content-Length'])
+
+    async def _fetch_range_async(
+            self, http: aiohttp.ClientSession, url: str, part_path: Path, start: int = 0, end: int = None,
+    ) -> Path:
+        """Fetch a byte range into a partial file, resuming it after transient errors (see `_fetch_range`)"""
+        failures = 0
+        reached = part_path.stat().st_size if part_path.exists() else 0
+
+        while True:
+            offset = start + (part_path.stat().st_size if part_path.exists() else 0)
+            if end is not None and offset > end:
+                return part_path
+
+            received = 0
+            headers = {}
+            if offset or end is not None:
+                headers['Range'] = 'bytes={}-{}'.format(offset, '' if end is None else end)
+
+            try:
+                async with http.get(url, headers=headers, timeout=self._timeout_async) as res:
+                    if res.status == 416 and end is None:  # Nothing left after offset
+                        return part_path
+
+                    res.raise_for_status()
+
+                    mode = 'ab'
+                    if headers and res.status != 206:
+                        if start or end is not None:
+                            raise aiohttp.ClientResponseError(
+                                res.request_info, res.history, status=res.status,
+                                message=f'Byte ranges not accepted for {url!r}',
+                            )
+                        mode = 'wb'  # The server ignored the Range header: start over
+
+                    expected = res.headers.get('Content-Length')
+
+                    # File I/O runs in a thread, one call at a time, while the next chunks are received
+                    # (aiohttp drops the received chunks on a connection error). The transfer only waits
+                    # for the disk when `write_buffer_bytes` are pending.
+                    opening = asyncio.ensure_future(asyncio.to_thread(open, part_path, mode))
+                    writing, buffer = opening, bytearray()
+
+                    try:
+                        async for chunk in res.content.iter_chunked(self.chunk_bytes):
+                            buffer += chunk
+                            received += len(chunk)
+
+                            if writing.done() or len(buffer) >= self.write_buffer_bytes:
+                                await writing
+                                write = opening.result().write
+                                writing = asyncio.ensure_future(asyncio.to_thread(write, bytes(buffer)))
+                                buffer.clear()
+
+                    finally:
+                        f = await opening
+                        try:
+                            await writing
+                            if buffer:
+                                await asyncio.to_thread(f.write, bytes(buffer))
+
+                        finally:
+                            await asyncio.to_thread(f.close)
+
+                    if expected is not None and received < int(expected):
+                        raise aiohttp.ClientPayloadError(f'Connection dropped after {received} of {expected} bytes')
+
+                return part_path
+
+            except ASYNC_TRANSIENT_ERRORS:
+                # Only attempts that moved the partial file past its furthest end reset the failures
+                size = part_path.stat().st_size if part_path.exists() else 0
+                failures, reached = (0, size) if size > reached else (failures + 1, reached)
+                if failures > self.retries:
+                    raise
+
+    @property
+    def _timeout_async(self) -> aiohttp.ClientTimeout:
+        """The asyncio HTTP timeout: `timeout` seconds on connect and on each read"""
+        return aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+
+    def verify(self, file_path: Path, checksum: str) -> bool:
+        """Check a local file against a hex digest"""
+        digest = hashlib.new(CHECKSUM_ALGORITHMS.get(len(checksum), 'md5'))
+
+        with open(file_path, 'rb') as f:
+            while chunk := f.read(self.chunk_bytes):
+                digest.update(chunk)
+
+        return digest.hexdigest() == checksum.lower()
@@ -0,0 +1,164 @@
+"""Engine module
+
+This module holds the dataframe engines used to transform and serialize the data.
+
+The pandas engine is the default. Polars and DuckDB (over Arrow) run multi-threaded string kernels and
+writers, and are optional dependencies: install `polars`, or `duckdb` and `pyarrow`, to select them.
+Parquet output with pandas also requires `pyarrow`.
+"""
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from numpy import ndarray, where
+from pandas.core.frame import DataFrame
+
+
+class PandasEngine:
+    """The pandas dataframe engine"""
+    name = 'pandas'
+
+    @staticmethod
+    def from_pandas(df: DataFrame) -> DataFrame:
+        """Convert a pandas DataFrame to this engine's frame"""
+        return df
+
+    @staticmethod
+    def column(df: DataFrame, name: str) -> ndarray:
+        """Get a column of a frame as a numpy array"""
+        return df[name].to_numpy()
+
+    @staticmethod
+    def create_derived_columns(df: DataFrame) -> DataFrame:
+        """Create the `a_count` and `contains_a` columns (see Transformer.create_derived_columns), in place"""
+        df['a_count'] = df['FullNm'].str.count('a').fillna(0).astype(int)
+        df['contains_a'] = where(df['a_count'] > 0, 'YES', 'NO')
+        return df
+
+    @staticmethod
+    def write(df: DataFrame, output_format: str = 'csv') -> bytes:
+        """Serialize a frame as CSV or Parquet"""
+        if output_format == 'parquet':
+            with BytesIO() as f:
+                df.to_parquet(f, index=False)
+                return f.getvalue()
+
+        return df.to_csv(index=False).encode()
+
+
+class PolarsEngine:
+    """The Polars dataframe engine"""
+    name = 'polars'
+
+    def __init__(self):
+        # Optional dependency (the `polars` extra)
+        import polars
+        self.pl = polars
+
+    def from_pandas(self, df: DataFrame):
+        """Convert a pandas DataFrame to this engine's frame"""
+        return self.pl.from_pandas(df)
+
+    @staticmethod
+    def column(df, name: str) -> ndarray:
+        """Get a column of a frame as a numpy array"""
+        return df[name].to_numpy()
+
+    def create_derived_columns(self, df):
+        """Create the `a_count` and `contains_a` columns (see Transformer.create_derived_columns)"""
+        pl = self.pl
+        a_count = pl.col('FullNm').str.count_matches('a', literal=True).fill_null(0).cast(pl.Int64)
+
+        return df.with_columns(a_count.alias('a_count')).with_columns(
+            pl.when(pl.col('a_count') > 0).then(pl.lit('YES')).otherwise(pl.lit('NO')).alias('contains_a'),
+        )
+
+    def write(self, df, output_format: str = 'csv') -> bytes:
+        """Serialize a frame as CSV or Parquet"""
+        if output_format == 'parquet':
+            with BytesIO() as f:
+                df.write_parquet(f)
+                return f.getvalue()
+
+        # Polars quotes empty strings (""), where pandas writes an empty field, as for nulls
+        strings = self.pl.col(self.pl.String)
+        return df.with_columns(self.pl.when(strings != '').then(strings)).write_csv().encode()
+
+
+class DuckDBEngine:
+    """The DuckDB dataframe engine, over Arrow tables"""
+    name = 'duckdb'
+
+    def __init__(self):
+        # Optional dependencies (the `duckdb` extra)
+        import duckdb
+        import pyarrow
+        self.pa = pyarrow
+        self.con = duckdb.connect()
+
+    def from_pandas(self, df: DataFrame):
+        """Convert a pandas DataFrame to this engine's frame"""
+        return self.pa.Table.from_pandas(df, preserve_index=False)
+
+    @staticmethod
+    def column(df, name: str) -> ndarray:
+        """Get a column of a frame as a numpy array"""
+        return df.column(name).to_numpy()
+
+    def create_derived_columns(self, df):
+        """Create the `a_count` and `contains_a` columns (see Transformer.create_derived_columns)"""
+        con = self.con.cursor()  # A cursor per call, as stages may run in several threads
+        con.register('df', df)
+
+        return con.sql(
+            """
+            SELECT *,
+                coalesce(length(FullNm) - length(replace(FullNm, 'a', '')), 0) AS a_count,
+                CASE WHEN a_count > 0 THEN 'YES' ELSE 'NO' END AS contains_a
+            FROM df
+            """,
+        ).to_arrow_table()
+
+    def write(self, df, output_format: str = 'csv') -> bytes:
+        """Serialize a frame as CSV or Parquet"""
+        con = self.con.cursor()
+        con.register('df', df)
+        source = 'df'
+        options = '(FORMAT parquet)'
+
+        if output_format != 'parquet':
+            # DuckDB quotes empty strings (""), where pandas writes an empty field, as for nulls
+            relation = con.sql('FROM df')
+            strings = [name for name, dtype in zip(relation.columns, relation.types) if dtype == 'VARCHAR']
+            if strings:
+                source = '(SELECT * REPLACE ({}) FROM df)'.format(
+                    ', '.join('nullif("{0}", \'\') AS "{0}"'.format(name.replace('"', '""')) for name in strings),
+                )
+            options = '(FORMAT csv, HEADER)'
+
+        with TemporaryDirectory() as temp_dir:
+            file_path = Path(temp_dir) / f'data.{output_format}'
+            con.execute(f"COPY {source} TO '{file_path}' {options}")
+            return file_path.read_bytes()
+
+
+ENGINES = {engine.name: engine for engine in (PandasEngine, PolarsEngine, DuckDBEngine)}
+
+
+def get_engine(name: str = 'pandas'):
+    """Create a dataframe engine by name
+
+    Args:
+        name (str): One of 'pandas', 'polars' or 'duckdb'
+
+    Returns:
+        (PandasEngine, PolarsEngine, DuckDBEngine): The engine
+
+    Raises:
+        ValueError: For an unknown engine name
+        ModuleNotFoundError: If the engine's optional dependency is not installed
+    """
+    if name not in ENGINES:
+        raise ValueError(f'Dataframe engine not recognized: {name!r}. Use one of {", ".join(ENGINES)}.')
+
+    return ENGINES[name]()
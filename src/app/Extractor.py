@@ -2,20 +2,90 @@
 
 This module holds the Extractor for the application's data
 """
-from io import BytesIO
-from zipfile import ZipFile
+import asyncio
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from mmap import ACCESS_READ, mmap
+from multiprocessing import get_context
+from pathlib import Path
+from struct import unpack_from
+from threading import Lock
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+from urllib.request import url2pathname
+from zipfile import ZIP_STORED, ZipFile, is_zipfile
 
+import aiohttp
 import requests
-from lxml.etree import fromstring, parse
+from lxml.etree import fromstring
+from pandas import concat
 from pandas.core.frame import DataFrame
 
+from .Downloader import Downloader
+
+TARGETED_ATTRIBUTES = ['Id', 'FullNm', 'ClssfctnTp', 'CmmdtyDerivInd', 'NtnlCcy', 'Issr']
+
+_FIN_INSTRM_START = re.compile(rb'<(?:\w+:)?FinInstrm[\s>]')
+_FIN_INSTRM_END = re.compile(rb'</(?:\w+:)?FinInstrm>')
+_NAMESPACES = re.compile(rb'xmlns(:\w+)?="[^"]*"')
+
+
+class _MappedFile(mmap):
+    """A read-only memory-mapped file, usable as a ZipFile stream (mmap is seekable only from Python 3.13)"""
+
+    def seekable(self) -> bool:
+        return True
+
 
 class Extractor:
-    def __init__(self):
-        ...
+    def __init__(
+            self,
+            session: requests.Session = None,
+            downloader: Downloader = None,
+            keep_downloads: bool = False,
+            parse_processes: int = 1,
+            shard_mb: float = 16,
+    ):
+        """Initialize the Extractor
 
-    @staticmethod
-    def fetch_package_url(source_xml_url: str = None, link_index: int = 1) -> (None, str):
+        Args:
+            session (requests.Session, optional): A session to keep HTTP connections open between requests
+            downloader (Downloader, optional): The downloader for the ZIP packages
+            keep_downloads (bool, optional): Keep the downloaded packages after parsing (a verified cache)
+            parse_processes (int, optional): Processes to parse the XML shards with. 1 parses in this process.
+            shard_mb (float, optional): Approximate size of the XML shards, split at FinInstrm boundaries
+        """
+        self.http = session or requests
+        self.downloader = downloader or Downloader(session=session)
+        self.keep_downloads = keep_downloads
+        self.parse_processes = max(1, parse_processes)
+        self.shard_bytes = int(1024 * 1024 * shard_mb)
+        self.checksums = {}
+        self._pool = None
+        self._pool_lock = Lock()
+
+    def close(self):
+        """Shut the parsing process pool down, if started"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _get_pool(self) -> (None, ProcessPoolExecutor):
+        """The parsing process pool, started once for all the pipeline threads. None parses in this process.
+
+        The processes are spawned, not forked: forking a multithreaded process can deadlock the children.
+        """
+        if self.parse_processes < 2:
+            return
+
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.parse_processes, mp_context=get_context('spawn'))
+
+            return self._pool
+
+    def fetch_package_url(self, source_xml_url: str = None, link_index: int = 1) -> (None, str):
         """Fetch the URL for the source ZIP file
 
         Args:
@@ -29,66 +99,458 @@ class Extractor:
             requests.exception.ConnectionError: For errors while resolving the URL domain
             requests.exceptions.HTTPError: For errors while fetching the XML file
         """
-        res = requests.get(source_xml_url)
+        urls = self.fetch_package_urls(source_xml_url=source_xml_url, min_urls=link_index + 1)
+        if len(urls) < (link_index + 1):
+            return
+
+        return urls[link_index]
+
+    def fetch_package_urls(self, source_xml_url: str = None, min_urls: int = None) -> list:
+        """Fetch the URLs for all the DLTINS source ZIP files
+
+        Args:
+            source_xml_url (str): URL to the XML containing the required data
+            min_urls (int, optional): Stop following the next result pages once this many URLs are fetched
+
+        Returns:
+            (list): The fetched URLs, in the XML order. Their checksums are kept in `self.checksums`.
+
+        Raises:
+            requests.exception.ConnectionError: For errors while resolving the URL domain
+            requests.exceptions.HTTPError: For errors while fetching the XML file
+        """
+        res = self.http.get(source_xml_url)
         res.raise_for_status()
+        urls, page_urls = self._read_package_links(res.content, source_xml_url)
+
+        for page_url in page_urls:
+            if min_urls is not None and len(urls) >= min_urls:
+                break
+
+            res = self.http.get(page_url)
+            res.raise_for_status()
+            urls += self._read_package_links(res.content)[0]
+
+        return urls
+
+    async def fetch_package_urls_async(
+            self,
+            http: aiohttp.ClientSession,
+            source_xml_url: str = None,
+            min_urls: int = None,
+    ) -> list:
+        """Fetch the URLs for all the DLTINS source ZIP files, with the next result pages fetched concurrently
+
+        Args:
+            http (aiohttp.ClientSession): The asyncio HTTP session
+            source_xml_url (str): URL to the XML containing the required data
+            min_urls (int, optional): Follow the next result pages one by one, until this many URLs are fetched
+
+        Returns:
+            (list): The fetched URLs, in the XML order. Their checksums are kept in `self.checksums`.
+
+        Raises:
+            aiohttp.ClientError: For errors while fetching the XML file
+        """
+        async def fetch(url: str) -> bytes:
+            async with http.get(url) as res:
+                res.raise_for_status()
+                return await res.read()
+
+        urls, page_urls = self._read_package_links(await fetch(source_xml_url), source_xml_url)
 
-        root = fromstring(res.content)
+        if min_urls is not None:
+            for page_url in page_urls:
+                if len(urls) >= min_urls:
+                    break
+
+                urls += self._read_package_links(await fetch(page_url))[0]
+
+            return urls
+
+        for content in await asyncio.gather(*(fetch(page_url) for page_url in page_urls)):
+            urls += self._read_package_links(content)[0]
+
+        return urls
+
+    def _read_package_links(self, content: bytes, source_xml_url: str = None) -> tuple:
+        """Read the DLTINS links of a Solr result page, keeping their checksums in `self.checksums`
+
+        Args:
+            content (bytes): The XML result page
+            source_xml_url (str, optional): The page URL, to get the URLs of the next pages (by `start` param)
+
+        Returns:
+            (tuple): The DLTINS URLs, and the URLs of the next result pages
+        """
+        root = fromstring(content)
         docs = root.findall(".//doc")
-        if len(docs) < (link_index + 1):
-            return
+        urls = []
 
-        i = 0
         for doc in docs:
             file_type = doc.find(".//str[@name='file_type']").text
 
             if file_type != 'DLTINS':
                 continue
 
-            if i == link_index:
-                url = doc.find(".//str[@name='download_link']").text
-                return url
+            url = doc.find(".//str[@name='download_link']").text
+            checksum = doc.find(".//str[@name='checksum']")
+            if checksum is not None:
+                self.checksums[url] = checksum.text
 
-            i += 1
+            urls.append(url)
 
-    @staticmethod
-    def parse_package_content(package_url: str) -> DataFrame:
+        result = root.find(".//result[@numFound]")
+        if source_xml_url is None or result is None or not docs:
+            return urls, []
+
+        start, found = int(result.get('start', 0)), int(result.get('numFound'))
+        parsed = urlparse(source_xml_url)
+        query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k != 'start']
+        page_urls = [
+            urlunparse(parsed._replace(query=urlencode(query + [('start', str(page_start))])))
+            for page_start in range(start + len(docs), found, len(docs))
+        ]
+
+        return urls, page_urls
+
+    def parse_package_content(self, package_url: str, checksum: str = None) -> DataFrame:
         """Parse the ZIP file content
 
         Args:
             package_url (str): The URL to the ZIP package containing the XML data file
+            checksum (str, optional): The package checksum. Defaults to the one fetched with its URL, if any.
 
         Returns:
             DataFrame: A pandas dataframe
         """
-        targeted_attributes = ['Id', 'FullNm', 'ClssfctnTp', 'CmmdtyDerivInd', 'NtnlCcy', 'Issr']
-        df = DataFrame(columns=targeted_attributes)
+        package = self.download({'url': package_url, 'checksum': checksum})
+        return self.parse(package)['df']
 
-        res = requests.get(package_url)
-        res.raise_for_status()
-        root = None
-
-        with ZipFile(BytesIO(res.content)) as z:
-            xml = z.namelist()[0]
-            with z.open(xml) as f:
-                root = parse(f).getroot()
-
-        if root is not None:  # As for lxml deprecation (FutureWarning)
-            temp_i = 0
-            for fin_instrm_list in root.findall('.//{*}FinInstrm'):
-                for fin_instrm in fin_instrm_list:
-                    item = {
-                        'Id': fin_instrm.find('.//{*}FinInstrmGnlAttrbts/{*}Id').text,
-                        'FullNm': fin_instrm.find('.//{*}FinInstrmGnlAttrbts/{*}FullNm').text,
-                        'ClssfctnTp': fin_instrm.find('.//{*}FinInstrmGnlAttrbts/{*}ClssfctnTp').text,
-                        'CmmdtyDerivInd': fin_instrm.find('.//{*}FinInstrmGnlAttrbts/{*}CmmdtyDerivInd').text,
-                        'NtnlCcy': fin_instrm.find('.//{*}FinInstrmGnlAttrbts/{*}NtnlCcy').text,
-                        'Issr': fin_instrm.find('.//{*}Issr').text,
-                    }
-
-                    df = df._append(item, ignore_index=True)
-
-                temp_i += 1
-                if temp_i > 5:
+    def download(self, package: dict) -> dict:
+        """Download a package (pipeline stage)
+
+        Local packages (paths and `file://` URLs) are used in place, and never removed (see `parse`).
+
+        Args:
+            package (dict): Having the package `url`, and optionally its `checksum`
+
+        Returns:
+            (dict): The package, with the local `path` to the verified ZIP file
+        """
+        url = package['url']
+        local_path = self.local_path(url)
+
+        if local_path is None:
+            package['path'] = self.downloader.download(url, checksum=package.get('checksum') or self.checksums.get(url))
+            return package
+
+        if package.get('checksum') and not self.downloader.verify(local_path, package['checksum']):
+            raise ValueError(f'Checksum mismatch for {url!r}: expected {package["checksum"]}')
+
+        package['path'] = local_path
+        package['local'] = True
+        return package
+
+    async def download_async(self, package: dict, http: aiohttp.ClientSession) -> dict:
+        """Download a package with an asyncio HTTP session (asyncio pipeline stage, see `download`)"""
+        url = package['url']
+
+        if self.local_path(url) is not None:
+            return await asyncio.to_thread(self.download, package)
+
+        checksum = package.get('checksum') or self.checksums.get(url)
+        package['path'] = await self.downloader.download_async(http, url, checksum=checksum)
+        return package
+
+    @staticmethod
+    def local_path(package_url: (str, Path)) -> (None, Path):
+        """Get the local path of a package given as a path or a `file://` URL
+
+        Args:
+            package_url (str, Path): The package path or URL
+
+        Returns:
+            (Path): The local path, or None for remote URLs (HTTP or other fsspec protocols)
+        """
+        parsed = urlparse(str(package_url))
+
+        if parsed.scheme == 'file':
+            return Path(url2pathname(parsed.path))
+
+        if len(parsed.scheme) <= 1:  # No scheme, or a Windows drive letter
+            return Path(package_url)
+
+    def parse(self, package: dict) -> dict:
+        """Parse a downloaded package (pipeline stage)
+
+        Args:
+            package (dict): Having the `path` to the local ZIP file, and `local` set if it was not downloaded
+
+        Returns:
+            (dict): The package, with the parsed `df` DataFrame
+        """
+        package_path = package.pop('path')
+        package['df'] = self.parse_package_file(package_path)
+
+        if not self.keep_downloads and not package.get('local'):
+            package_path.unlink()
+
+        return package
+
+    def parse_package_file(self, package_path: (str, Path)) -> DataFrame:
+        """Parse a local ZIP file content
+
+        Args:
+            package_path (str, Path): Path to the ZIP package containing the XML data files
+
+        Returns:
+            DataFrame: A pandas dataframe
+        """
+        batches = list(self.iter_package_batches(package_path))
+        if not batches:
+            return DataFrame(columns=TARGETED_ATTRIBUTES)
+
+        return concat(batches, ignore_index=True)
+
+    def iter_package_batches(self, package_path: (str, Path)):
+        """Parse every XML member of a local ZIP file (or a local XML file), as ordered record batches
+
+        Each member is split at FinInstrm element boundaries into shards of about `shard_mb`, and the shards
+        of all the members are parsed by a process pool (if `parse_processes` > 1). Shards are submitted as
+        the members are read, with a bounded number in flight.
+
+        The file is memory-mapped. Stored (uncompressed) members, and XML files, are split in place: only the
+        shard offsets are handed to the parsing processes, which map the file themselves, or the shards are
+        sliced from the mapped file when parsing in this process. Deflated members are decompressed as a
+        stream from the mapped file.
+
+        Args:
+            package_path (str, Path): Path to the ZIP package containing the XML data files, or to an XML file
+
+        Yields:
+            DataFrame: The records of one shard, in the members and file order
+        """
+        in_flight = deque()
+        max_in_flight = 2 * self.parse_processes
+        pool = self._get_pool()
+
+        for func, args in self._iter_shards(Path(package_path), in_process=pool is None):
+            if pool is None:
+                yield DataFrame(func(*args), columns=TARGETED_ATTRIBUTES)
+                continue
+
+            in_flight.append(pool.submit(func, *args))
+            if len(in_flight) >= max_in_flight:
+                yield DataFrame(in_flight.popleft().result(), columns=TARGETED_ATTRIBUTES)
+
+        while in_flight:
+            yield DataFrame(in_flight.popleft().result(), columns=TARGETED_ATTRIBUTES)
+
+    def _iter_shards(self, package_path: Path, in_process: bool = False):
+        """Split a local ZIP or XML file in shards, as the parsing function and its arguments
+
+        Args:
+            package_path (Path): The local ZIP or XML file
+            in_process (bool, optional): Slice the shards from this mapping, instead of handing their offsets
+
+        Yields:
+            (tuple): `_parse_mapped_shard` and the shard offsets, or `_parse_shard` and the shard bytes
+        """
+        if not package_path.stat().st_size:
+            return
+
+        with open(package_path, 'rb') as f, _MappedFile(f.fileno(), 0, access=ACCESS_READ) as mm:
+            def mapped_shard(start: int, end: int, open_tag: bytes) -> tuple:
+                if in_process:
+                    return _parse_shard, (_read_mapped_shard(mm, start, end, open_tag),)
+                return _parse_mapped_shard, (str(package_path), start, end, open_tag)
+
+            if not is_zipfile(mm):
+                for start, end, open_tag in self._split_mapped_xml(mm, 0, len(mm), self.shard_bytes):
+                    yield mapped_shard(start, end, open_tag)
+                return
+
+            with ZipFile(mm) as z:
+                for member in z.infolist():
+                    if member.is_dir():
+                        continue
+
+                    if member.compress_type == ZIP_STORED and not member.flag_bits & 0x1:  # Not encrypted
+                        data_start = self._member_data_offset(mm, member)
+                        data_end = data_start + member.compress_size
+
+                        for start, end, open_tag in self._split_mapped_xml(mm, data_start, data_end, self.shard_bytes):
+                            yield mapped_shard(start, end, open_tag)
+                        continue
+
+                    with z.open(member) as f:
+                        for shard in self._split_xml(f, self.shard_bytes):
+                            yield _parse_shard, (shard,)
+
+    @staticmethod
+    def _member_data_offset(mm: mmap, member) -> int:
+        """Find where the data of a ZIP member starts, after its local file header"""
+        signature, name_length, extra_length = unpack_from('<4s22xHH', mm, member.header_offset)
+
+        if signature != b'PK\x03\x04':
+            raise ValueError(f'Bad local file header for ZIP member {member.filename!r}')
+
+        return member.header_offset + 30 + name_length + extra_length
+
+    @staticmethod
+    def _split_mapped_xml(buffer, start: int, end: int, shard_bytes: int):
+        """Split an XML document in a buffer into shards of whole FinInstrm elements, without copying it
+
+        Same as `_split_xml`, for a memory-mapped file.
+
+        Args:
+            buffer (mmap, bytes): The buffer having the XML document
+            start (int): Where the document starts in the buffer
+            end (int): Where the document ends in the buffer
+            shard_bytes (int): The approximate shard size
+
+        Yields:
+            (tuple): The shard start and end offsets, and the <Shard> opening tag to wrap it with
+        """
+        first = _FIN_INSTRM_START.search(buffer, start, end)
+        if first is None:
+            return
+
+        namespaces = {m.group(1): m.group(0) for m in _NAMESPACES.finditer(buffer, start, first.start())}
+        open_tag = b'<Shard %s>' % b' '.join(namespaces.values())  # The innermost (last) declarations
+        position = first.start()
+
+        while position < end:
+            cut = _fin_instrm_end(buffer, min(position + shard_bytes, end), start=position, end=end)
+            if cut == -1:
+                return
+
+            yield position, cut, open_tag
+            position = cut
+
+    @staticmethod
+    def _split_xml(f, shard_bytes: int, chunk_bytes: int = 1024 * 1024):
+        """Split an XML stream into well-formed shards of whole FinInstrm elements
+
+        The bytes before the first FinInstrm (and after the last one) are left out. Each shard wraps its
+        FinInstrm elements in a <Shard> element, having the namespace declarations of the XML header.
+
+        Args:
+            f (file): The XML binary stream
+            shard_bytes (int): The approximate shard size
+            chunk_bytes (int, optional): The size of each read from the stream
+
+        Yields:
+            bytes: A shard
+        """
+        buffer = bytearray()
+        open_tag = None
+
+        while True:
+            chunk = f.read(chunk_bytes)
+            buffer += chunk
+
+            if open_tag is None:
+                start = _FIN_INSTRM_START.search(buffer)
+                if start is None:
+                    if not chunk:
+                        return
+                    continue
+
+                namespaces = {m.group(1): m.group(0) for m in _NAMESPACES.finditer(buffer, 0, start.start())}
+                open_tag = b'<Shard %s>' % b' '.join(namespaces.values())  # The innermost (last) declarations
+                del buffer[:start.start()]
+
+            while len(buffer) >= shard_bytes or not chunk:
+                cut = _fin_instrm_end(buffer, shard_bytes if chunk else len(buffer))
+                if cut == -1:
                     break
 
-        return df
+                yield open_tag + bytes(buffer[:cut]) + b'</Shard>'
+                del buffer[:cut]
+
+            if not chunk:
+                return
+
+
+def _fin_instrm_end(buffer, limit: int, start: int = 0, end: int = None) -> int:
+    """Find the position right after the last FinInstrm closing tag between `start` and `limit`
+
+    If there is none (a FinInstrm larger than a shard), the first closing tag after `limit` is used.
+
+    Args:
+        buffer (bytearray, mmap): The buffer to search
+        limit (int): The position to find a closing tag before
+        start (int, optional): The position to search from
+        end (int, optional): The position to search a closing tag after `limit` up to. Defaults to the buffer end.
+
+    Returns:
+        (int): The position, or -1 if there is no closing tag in the buffer
+    """
+    cut = buffer.rfind(b'FinInstrm>', start, limit)
+
+    while cut != -1:
+        tag_start = buffer.rfind(b'<', start, cut)
+        if tag_start != -1 and _FIN_INSTRM_END.fullmatch(buffer, tag_start, cut + len(b'FinInstrm>')):
+            return cut + len(b'FinInstrm>')
+        cut = buffer.rfind(b'FinInstrm>', start, cut)
+
+    found = _FIN_INSTRM_END.search(buffer, max(start, limit - 64), len(buffer) if end is None else end)
+    return -1 if found is None else found.end()
+
+
+def _parse_shard(shard: bytes) -> dict:
+    """Parse the records of an XML shard (see Extractor._split_xml)
+
+    Module level, so it can be pickled to the parsing processes.
+
+    Args:
+        shard (bytes): The shard of FinInstrm elements
+
+    Returns:
+        (dict): The targeted attributes, as columns of values
+    """
+    def text(element, path: str) -> (None, str):
+        found = element.find(path)
+        return None if found is None else found.text
+
+    columns = {attribute: [] for attribute in TARGETED_ATTRIBUTES}
+
+    for fin_instrm_list in fromstring(shard).iterfind('{*}FinInstrm'):
+        for fin_instrm in fin_instrm_list:
+            columns['Id'].append(text(fin_instrm, './/{*}FinInstrmGnlAttrbts/{*}Id'))
+            columns['FullNm'].append(text(fin_instrm, './/{*}FinInstrmGnlAttrbts/{*}FullNm'))
+            columns['ClssfctnTp'].append(text(fin_instrm, './/{*}FinInstrmGnlAttrbts/{*}ClssfctnTp'))
+            columns['CmmdtyDerivInd'].append(text(fin_instrm, './/{*}FinInstrmGnlAttrbts/{*}CmmdtyDerivInd'))
+            columns['NtnlCcy'].append(text(fin_instrm, './/{*}FinInstrmGnlAttrbts/{*}NtnlCcy'))
+            columns['Issr'].append(text(fin_instrm, './/{*}Issr'))
+
+    return columns
+
+
+def _parse_mapped_shard(file_path: str, start: int, end: int, open_tag: bytes) -> dict:
+    """Parse the records of an XML shard in a file, by its offsets (see Extractor._split_mapped_xml)
+
+    Module level, so it can be pickled to the parsing processes: only the offsets are sent, and the
+    shard is read from the memory-mapped file.
+
+    Args:
+        file_path (str): The local ZIP or XML file
+        start (int): The shard start offset
+        end (int): The shard end offset
+        open_tag (bytes): The <Shard> opening tag to wrap it with
+
+    Returns:
+        (dict): The targeted attributes, as columns of values
+    """
+    with open(file_path, 'rb') as f, mmap(f.fileno(), 0, access=ACCESS_READ) as mm:
+        shard = _read_mapped_shard(mm, start, end, open_tag)
+
+    return _parse_shard(shard)
+
+
+def _read_mapped_shard(mm: mmap, start: int, end: int, open_tag: bytes) -> bytes:
+    """Copy an XML shard out of a memory-mapped file, wrapped in its <Shard> element"""
+    with memoryview(mm) as view:
+        return b''.join((open_tag, view[start:end], b'</Shard>'))
@@ -1,4 +1,8 @@
+from json import dump, load
+from os import replace, stat_result
 from pathlib import Path
+from tempfile import mkstemp
+from time import time
 
 import fsspec
 from fsspec.implementations.local import LocalFileSystem as LocalFS
@@ -11,13 +15,31 @@ class FS:
 
     This class enables and validates connections to different filesystems using the fsspec library.
 
+    Connected file systems are kept in a pool shared by all FS objects, keyed by the storage reference and
+    the secret file fingerprint, so the secret files are only read again when they change.
+    Location validations are remembered for `validation_ttl` seconds, in-process and in the `state_file`,
+    so repeated runs skip the round trips to S3 or Azure. Use `invalidate()` after a failed write.
+
     Examples:
         > fs = FS().connect(local_dir='data')
         > fs = FS().connect(aws_bucket=aws_bucket, aws_secret_file=aws_secret_file, aws_key=aws_key)
+        > fs = FS(validation_ttl=3600, state_file='/tmp/fs-state.json').connect(local_dir='data')
     """
 
-    def __init__(self):
-        pass
+    _pool = {}
+    _validated = {}
+
+    def __init__(self, validation_ttl: float = 0, state_file: (str, Path) = None, log=None):
+        """Initialize the FS connector
+
+        Args:
+            validation_ttl (float, optional): Seconds to trust a successful location validation. 0 disables it.
+            state_file (str, Path, optional): JSON file to share validations between runs.
+            log (logging.Logger, optional): The logger to report to
+        """
+        self.validation_ttl = validation_ttl
+        self.state_file = Path(state_file) if state_file else None
+        self.log = log
 
     def connect(self, **kwargs) -> (LocalFS, AzureFS, S3FS):
         """Connect to a storage system, and validate the connection and location.
@@ -42,44 +64,156 @@ class FS:
         """
         if 'local_dir' in kwargs:
             reference = 'local'
-            attrs = {'protocol': 'file'}
+            protected_file = None
             location = kwargs['local_dir']
 
         elif 'azure_conn_string_file' in kwargs:
             reference = 'azure'
             protected_file = kwargs['azure_conn_string_file']
-            protected_data = self._fetch_from_protected_file(protected_file, reference=reference)
-            attrs = {'protocol': 'az', 'connection_string': protected_data}
             location = kwargs['azure_container']
 
         elif 'aws_secret_file' in kwargs:
             reference = 'aws'
             protected_file = kwargs['aws_secret_file']
-            protected_data = self._fetch_from_protected_file(protected_file, reference=reference)
-            attrs = {'protocol': 's3', 'key': kwargs['aws_key'], 'secret': protected_data}
             location = kwargs['aws_bucket']
 
         else:
             raise ValueError('File system not recognized')
 
-        fs = fsspec.filesystem(**attrs)
-        self._validate_fs_location(filesystem=fs, location=location)
+        key = (reference, str(protected_file), kwargs.get('aws_key'))
+        fingerprint = None
+        if protected_file:
+            st = self._check_protected_file(protected_file)
+            fingerprint = (st.st_mtime_ns, st.st_size)
+
+        fs, pooled_fingerprint = self._pool.get(key, (None, None))
+        if fs is None or pooled_fingerprint != fingerprint:
+            if reference == 'local':
+                attrs = {'protocol': 'file'}
+            elif reference == 'azure':
+                protected_data = self._fetch_from_protected_file(protected_file, reference=reference)
+                attrs = {'protocol': 'az', 'connection_string': protected_data}
+            else:
+                protected_data = self._fetch_from_protected_file(protected_file, reference=reference)
+                attrs = {'protocol': 's3', 'key': kwargs['aws_key'], 'secret': protected_data}
+
+            fs = fsspec.filesystem(**attrs)
+            self._pool[key] = (fs, fingerprint)
+
+        validation_key = '{}:{}:{}'.format(*key[:2], location)
+        if not self._is_validated(validation_key):
+            self._validate_fs_location(filesystem=fs, location=location)
+            self._set_validated(validation_key)
 
         return fs
 
+    def invalidate(self, filesystem: (LocalFS, AzureFS, S3FS), location: str = None):
+        """Forget a pooled file system and its remembered validations
+
+        Call it when a write fails, so the next `connect()` reconnects and validates the location again.
+
+        Args:
+            filesystem (LocalFileSystem, AzureBlobFileSystem, S3FileSystem): The file system object to forget.
+            location (str, optional): Forget only the validation of this location. Defaults to all locations.
+        """
+        references = set()
+        for key, (fs, _) in list(self._pool.items()):
+            if fs is filesystem:
+                references.add('{}:{}:'.format(*key[:2]))
+                del self._pool[key]
+
+        if not references:
+            return
+
+        filesystem.invalidate_cache()
+        type(filesystem).clear_instance_cache()
+
+        state = self._load_state()
+        for validation_key in set(self._validated) | set(state):
+            for prefix in references:
+                if validation_key == f'{prefix}{location}' or (location is None and validation_key.startswith(prefix)):
+                    self._validated.pop(validation_key, None)
+                    state.pop(validation_key, None)
+
+        self._save_state(state)
+
+    def _is_validated(self, validation_key: str) -> bool:
+        """Check if a location validation is still within its TTL, in-process or in the state file"""
+        if not self.validation_ttl:
+            return False
+
+        expires = self._validated.get(validation_key)
+        if expires is None:
+            expires = self._load_state().get(validation_key)
+            if expires is not None:
+                self._validated[validation_key] = expires
+
+        return expires is not None and expires > time()
+
+    def _set_validated(self, validation_key: str):
+        """Remember a successful location validation for `validation_ttl` seconds"""
+        if not self.validation_ttl:
+            return
+
+        now = time()
+        expires = now + self.validation_ttl
+        self._validated[validation_key] = expires
+
+        state = {k: v for k, v in self._load_state().items() if v > now}
+        state[validation_key] = expires
+        self._save_state(state)
+
+    def _load_state(self) -> dict:
+        """Load remembered validations from the state file, if any"""
+        if not self.state_file or not self.state_file.is_file():
+            return {}
+
+        try:
+            with open(self.state_file) as f:
+                state = load(f)
+        except (OSError, ValueError):
+            return {}  # A broken state only costs a new validation
+
+        return state if isinstance(state, dict) else {}
+
+    def _save_state(self, state: dict):
+        """Atomically write remembered validations to the state file, if set
+
+        Each write has its own temporary file, so concurrent runs never replace each other's. A failed write
+        only costs new validations: it is reported, not raised.
+        """
+        if not self.state_file:
+            return
+
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_file = mkstemp(dir=self.state_file.parent, prefix=f'.{self.state_file.name}.', suffix='.tmp')
+
+            try:
+                with open(fd, 'w') as f:
+                    dump(state, f)
+
+                replace(temp_file, self.state_file)
+
+            finally:
+                Path(temp_file).unlink(missing_ok=True)
+
+        except OSError as e:
+            if self.log:
+                self.log.warning(f'Could not save the storage validations to {self.state_file}: {e}')
+
     @staticmethod
-    def _fetch_from_protected_file(filepath: str, reference: str) -> str:
-        """Fetch the content of a protected file
+    def _check_protected_file(filepath: str) -> stat_result:
+        """Check that a protected file exists and is only readable by its owner
 
         Args:
-            filepath (str): Path to a protected file having a string
-            reference (str): One of 'azure' or 'aws'
+            filepath (str): Path to a protected file
 
         Returns:
-            (str): A validated string (Azure's connection string, or AWS' secret)
+            (stat_result): The file status, used as a fingerprint of its content
 
         Raises:
-            (FileNotFoundError, PermissionError, ValueError)
+            (FileNotFoundError, PermissionError)
         """
         filepath = Path(filepath)
 
@@ -87,10 +221,30 @@ class FS:
             msg = f'Secret file {str(filepath)!r} not found.'
             raise FileNotFoundError(msg)
 
-        if filepath.stat().st_mode & 0o777 != 0o600:
+        st = filepath.stat()
+        if st.st_mode & 0o777 != 0o600:
             msg = f'The file {str(filepath)!r} should be protected. I will not use this data.'
             raise PermissionError(msg)
 
+        return st
+
+    @classmethod
+    def _fetch_from_protected_file(cls, filepath: str, reference: str) -> str:
+        """Fetch the content of a protected file
+
+        Args:
+            filepath (str): Path to a protected file having a string
+            reference (str): One of 'azure' or 'aws'
+
+        Returns:
+            (str): A validated string (Azure's connection string, or AWS' secret)
+
+        Raises:
+            (FileNotFoundError, PermissionError, ValueError)
+        """
+        filepath = Path(filepath)
+        cls._check_protected_file(filepath)
+
         with open(filepath) as f:
             secret = f.readline().strip()
 
@@ -0,0 +1,203 @@
+"""Index module
+
+This module builds and reads the sidecar indexes of the stored files, to look instruments up by Id
+"""
+from io import BytesIO
+
+import numpy as np
+from pandas.util import hash_array
+from fsspec.implementations.local import LocalFileSystem as LocalFS
+from adlfs.spec import AzureBlobFileSystem as AzureFS
+from s3fs.core import S3FileSystem as S3FS
+
+_MAGIC = b'APPIDX01'
+_HEADER = np.dtype([('magic', 'S8'), ('count', '<u8'), ('page_records', '<u8'), ('header_length', '<u8')])
+
+
+class Index:
+    """The sidecar index of a stored file (i.e. `data.20241024-1537Z.csv.idx` for `data.20241024-1537Z.csv`)
+
+    The index holds a fixed-width record per row of the stored file, sorted by the 64-bit hash of its Id:
+    - CSV: the byte `offset` and `length` of the row
+    - Parquet: the row group (as `offset`) and the row within it (as `length`)
+
+    It also holds the first hash of every page of `PAGE_RECORDS` records, so that a lookup reads these
+    fences once (they are kept in the object), then one page per Id, with range reads on any fsspec file system.
+
+    Layout: a 32-byte header (magic, records count, records per page, CSV header length), the fences, the records.
+
+    Examples:
+        > data = engine.write(df, 'csv')
+        > sidecar = Index.build(df['Id'], data, 'csv')
+        > records = Index(fs, 'data/data.20241024-1537Z.csv.idx').find(Index.hash(['EZ1GTXGHFK10']))
+    """
+
+    SUFFIX = '.idx'
+    PAGE_RECORDS = 256
+    RECORD = np.dtype([('key', '<u8'), ('offset', '<u8'), ('length', '<u8')])
+
+    def __init__(self, fs: (LocalFS, AzureFS, S3FS), file_path: str):
+        """Initialize the reader of a sidecar index. Nothing is read until `find` is called.
+
+        Args:
+            fs (LocalFS, AzureFS, S3FS): The file system having the index
+            file_path (str): The index path, including the directory, Container or Bucket name
+        """
+        self.fs = fs
+        self.file_path = file_path
+        self.count = None
+        self.page_records = None
+        self.header_length = None
+        self._fences = None
+
+    @staticmethod
+    def hash(ids) -> np.ndarray:
+        """Hash Ids to 64 bits (the same hash as the Deduplicator's)"""
+        return hash_array(np.asarray(ids, dtype=object))
+
+    @classmethod
+    def build(cls, ids, data: bytes, output_format: str = 'csv') -> bytes:
+        """Build the sidecar index of a serialized file
+
+        Args:
+            ids (array-like): The Id of every row, in the file order
+            data (bytes): The serialized file, as CSV (with a header line) or Parquet
+            output_format (str, optional): One of 'csv' or 'parquet'
+
+        Returns:
+            (bytes): The sidecar index
+
+        Raises:
+            ValueError: If the file does not have as many rows as Ids
+        """
+        header_length = 0
+
+        if output_format == 'parquet':
+            # Optional dependency, required to read Parquet (the `parquet` extra)
+            from pyarrow.parquet import ParquetFile
+
+            metadata = ParquetFile(BytesIO(data)).metadata
+            group_rows = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+            offsets = np.repeat(np.arange(len(group_rows)), group_rows)
+            starts = np.repeat(np.cumsum([0] + group_rows[:-1]), group_rows)
+            lengths = np.arange(len(offsets)) - starts
+
+        else:
+            ends = cls.csv_row_ends(data)
+            header_length = int(ends[0]) if len(ends) else 0
+            offsets = ends[:-1]
+            lengths = ends[1:] - ends[:-1]
+
+        return cls.pack(ids, offsets, lengths, header_length=header_length)
+
+    @classmethod
+    def pack(cls, ids, offsets, lengths, header_length: int = 0) -> bytes:
+        """Pack the rows positions of a file as its sidecar index
+
+        Args:
+            ids (array-like): The Id of every row
+            offsets (array-like): The byte offset (CSV) or row group (Parquet) of every row
+            lengths (array-like): The byte length (CSV) or row within its group (Parquet) of every row
+            header_length (int, optional): The CSV header length, in bytes
+
+        Returns:
+            (bytes): The sidecar index
+
+        Raises:
+            ValueError: If there are not as many rows as Ids
+        """
+        if not len(offsets) == len(lengths) == len(ids):
+            raise ValueError(f'Cannot index {len(offsets)} rows with {len(ids)} Ids')
+
+        records = np.empty(len(ids), dtype=cls.RECORD)
+        records['key'] = cls.hash(ids)
+        records['offset'] = offsets
+        records['length'] = lengths
+        records.sort(order='key', kind='stable')
+
+        header = np.array([(_MAGIC, len(records), cls.PAGE_RECORDS, header_length)], dtype=_HEADER)
+        fences = records['key'][::cls.PAGE_RECORDS]
+        return header.tobytes() + fences.tobytes() + records.tobytes()
+
+    @staticmethod
+    def csv_row_ends(data: bytes, chunk_bytes: int = 64 * 1024 * 1024) -> np.ndarray:
+        """Find where each CSV line ends (after its line break), skipping the line breaks in quoted values
+
+        Args:
+            data (bytes): The CSV file
+            chunk_bytes (int, optional): Bytes to scan at once, bounding the memory used
+
+        Returns:
+            (ndarray): The end offsets, the first one being the header's
+        """
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        ends = []
+        quoted = 0
+
+        for start in range(0, len(buffer), chunk_bytes):
+            chunk = buffer[start:start + chunk_bytes]
+            line_breaks = np.flatnonzero(chunk == ord('\n'))
+            quotes = np.flatnonzero(chunk == ord('"'))
+
+            # A line break after an odd count of quotes is inside a quoted value ("" escapes count twice)
+            inside = (np.searchsorted(quotes, line_breaks) + quoted) % 2 == 1
+            ends.append(line_breaks[~inside] + start + 1)
+            quoted = (quoted + len(quotes)) % 2
+
+        ends = np.concatenate(ends) if ends else np.empty(0, dtype=np.int64)
+        if len(buffer) and (not len(ends) or ends[-1] < len(buffer)):
+            ends = np.append(ends, len(buffer))
+
+        return ends.astype(np.uint64)
+
+    def find(self, hashes: np.ndarray) -> np.ndarray:
+        """Find the records of hashed Ids, reading only the index pages that may have them
+
+        Args:
+            hashes (ndarray): 64-bit hashes of the Ids (see `hash`)
+
+        Returns:
+            (ndarray): The matching records (see `RECORD`), by file order. Hash collisions are possible:
+                check the Id of the rows read.
+        """
+        if self._fences is None:
+            self._load()
+
+        hashes = np.unique(np.asarray(hashes, dtype=np.uint64))
+        if not self.count or not len(hashes):
+            return np.empty(0, dtype=self.RECORD)
+
+        # Equal keys may span several pages: from the page before the first fence >= hash, to the last fence <= hash
+        first = np.maximum(np.searchsorted(self._fences, hashes, side='left') - 1, 0)
+        last = np.maximum(np.searchsorted(self._fences, hashes, side='right') - 1, 0)
+        pages = np.unique(np.concatenate([np.arange(f, l + 1) for f, l in zip(first, last)]))
+
+        records_start = _HEADER.itemsize + self._fences.nbytes
+        starts = [records_start + int(page) * self.page_records * self.RECORD.itemsize for page in pages]
+        ends = [
+            records_start + min(int(page + 1) * self.page_records, self.count) * self.RECORD.itemsize
+            for page in pages
+        ]
+        chunks = self.fs.cat_ranges([self.file_path] * len(pages), starts, ends, on_error='raise')
+        records = np.frombuffer(b''.join(chunks), dtype=self.RECORD)
+
+        found = records[np.isin(records['key'], hashes)]
+        return found[np.lexsort((found['length'], found['offset']))]
+
+    def _load(self):
+        """Read the header and the page fences"""
+        header = np.frombuffer(self.fs.cat_file(self.file_path, start=0, end=_HEADER.itemsize), dtype=_HEADER)
+
+        if len(header) != 1 or header['magic'][0] != _MAGIC:
+            raise ValueError(f'Not an index file: {self.file_path}')
+
+        self.count = int(header['count'][0])
+        self.page_records = int(header['page_records'][0])
+        self.header_length = int(header['header_length'][0])
+        fences = -(-self.count // self.page_records)
+
+        if fences:
+            end = _HEADER.itemsize + fences * 8
+            self._fences = np.frombuffer(self.fs.cat_file(self.file_path, start=_HEADER.itemsize, end=end), '<u8')
+        else:
+            self._fences = np.empty(0, dtype=np.uint64)
@@ -0,0 +1,276 @@
+"""Pipeline module
+
+This module runs the application stages concurrently, connected by bounded queues
+"""
+from inspect import isgenerator
+from queue import Queue
+from threading import Condition, Lock, Thread
+from time import perf_counter
+
+_DONE = object()
+_SKIPPED = object()  # Stands for a dropped or failed item, so ordered stages do not wait for it
+
+
+class Stage:
+    """A pipeline stage
+
+    Examples:
+        > Stage('parse', extractor.parse, workers=2)
+    """
+
+    def __init__(self, name: str, func: callable, workers: int = 1, queue_size: int = 2, ordered: bool = False):
+        """Initialize a Stage
+
+        Args:
+            name (str): The stage name, used in logs and metrics
+            func (callable): Handles one item. Returns the next item, None to drop it, or a generator of items.
+            workers (int, optional): Threads handling this stage
+            queue_size (int, optional): Maximum items waiting for this stage (backpressure to the previous one)
+            ordered (bool, optional): Handle the items in the order they were fed, with a single worker.
+                The previous stages must return one item (or None) per item.
+        """
+        self.name = name
+        self.func = func
+        self.workers = 1 if ordered else max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.ordered = ordered
+
+
+class Pipeline:
+    """The staged pipeline runtime
+
+    Items flow through the stages in order. Each stage has its own worker threads and a bounded input
+    queue, so a slow stage blocks the previous ones instead of letting items pile up in memory.
+    Items in the queues are also bounded by a global memory budget: an item waits for the items queued for
+    its stage and the next ones to fit in it, so the later stages always make room for the earlier ones.
+    A failed item is logged and dropped, without stopping the other items. An `ordered` stage handles the
+    items in the order they were fed: the items it holds back, waiting for an earlier one, count in the
+    memory budget, and no more items are fed while it is used up (they never hold up a stage, which could
+    keep the awaited item from coming).
+
+    Examples:
+        > Pipeline([Stage('double', lambda x: x * 2), Stage('add', lambda x: x + 1)]).run([1, 2, 3])
+    """
+
+    def __init__(self, stages: list, memory_budget_mb: float = 0, sizeof: callable = None, log=None):
+        """Initialize a Pipeline
+
+        Args:
+            stages (list): The Stage objects, in order
+            memory_budget_mb (float, optional): Maximum size of the queued items. 0 disables it.
+            sizeof (callable, optional): Estimates the size of an item, in bytes. Defaults to `Pipeline.sizeof`.
+            log (logging.Logger, optional): The logger to report to
+        """
+        self.stages = stages
+        self.memory_budget = int(1024 * 1024 * memory_budget_mb)
+        self.sizeof = sizeof or self.sizeof
+        self.log = log
+
+        self.errors = []
+        self.metrics = {}
+        self._queued_bytes = 0
+        self._held_bytes = 0
+        self._stage_bytes = [0] * len(stages)
+        self._index = {stage.name: i for i, stage in enumerate(stages)}
+        self._budget = Condition()
+        self._lock = Lock()
+
+    def run(self, items) -> list:
+        """Run the items through all the stages, and wait for them to finish
+
+        Args:
+            items (iterable): The items to feed the first stage with. Consumed lazily.
+
+        Returns:
+            (list): The items returned by the last stage, in completion order
+        """
+        self.errors = []
+        self._queued_bytes = self._held_bytes = 0
+        self._stage_bytes = [0] * len(self.stages)
+        self.metrics = {
+            stage.name: {'queued': 0, 'max_queued': 0, 'processed': 0, 'failed': 0, 'busy_seconds': 0.0}
+            for stage in self.stages
+        }
+
+        queues = [Queue(maxsize=stage.queue_size) for stage in self.stages]
+        results = []
+        threads = []
+
+        for i, stage in enumerate(self.stages):
+            next_queue = queues[i + 1] if i + 1 < len(queues) else None
+            running = [stage.workers]
+
+            for _ in range(stage.workers):
+                thread = Thread(
+                    target=self._work, args=(stage, queues[i], next_queue, results, running),
+                    name=f'pipeline-{stage.name}', daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for seq, item in enumerate(items):
+                self._admit()
+                self._put(queues[0], self.stages[0], seq, item)
+
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+
+            for thread in threads:
+                thread.join()
+
+        if self.log:
+            for name, metrics in self.metrics.items():
+                self.log.debug(f'Stage {name}: {metrics}')
+
+        return results
+
+    def _work(self, stage: Stage, queue: Queue, next_queue: (None, Queue), results: list, running: list):
+        """Handle items from a stage queue until it is done, then pass the end on to the next stage"""
+        next_stage = self.stages[self.stages.index(stage) + 1] if next_queue else None
+        pending = {}
+        next_seq = 0
+
+        while (envelope := queue.get()) is not _DONE:
+            seq, item, size = envelope
+
+            if not stage.ordered:
+                self._release(stage, size)
+                self._handle(stage, seq, item, next_stage, next_queue, results)
+                continue
+
+            pending[seq] = item, size  # Held back items stay in the memory budget until handled
+            self._hold(stage, size)
+
+            while next_seq in pending:
+                item, size = pending.pop(next_seq)
+                self._release(stage, size, held=True)
+                self._handle(stage, next_seq, item, next_stage, next_queue, results)
+                next_seq += 1
+
+        for seq in sorted(pending):
+            item, size = pending.pop(seq)
+            self._release(stage, size, held=True)
+            self._handle(stage, seq, item, next_stage, next_queue, results)
+
+        with self._lock:
+            running[0] -= 1
+            last = running[0] == 0
+
+        if last and next_queue is not None:
+            for _ in range(next_stage.workers):
+                next_queue.put(_DONE)
+
+    def _handle(self, stage: Stage, seq: int, item, next_stage: Stage, next_queue: Queue, results: list):
+        """Handle one item in a stage, and pass its outputs (or its absence) on to the next stage"""
+        forwarded = False
+
+        if item is not _SKIPPED:
+            started = perf_counter()
+            try:
+                output = stage.func(item)
+                outputs = output if isgenerator(output) else (output,)
+
+                for output in outputs:
+                    if output is None:
+                        continue
+                    if next_queue is None:
+                        with self._lock:
+                            results.append(output)
+                    else:
+                        self._put(next_queue, next_stage, seq, output)
+                    forwarded = True
+
+            except Exception as e:
+                with self._lock:
+                    self.metrics[stage.name]['failed'] += 1
+                    self.errors.append((stage.name, item, e))
+
+                if self.log:
+                    self.log.error(f'Stage {stage.name} failed for an item. See logs for details.')
+                    self.log.debug(e)
+
+            finally:
+                with self._lock:
+                    self.metrics[stage.name]['processed'] += 1
+                    self.metrics[stage.name]['busy_seconds'] += perf_counter() - started
+
+        if not forwarded and next_queue is not None:
+            self._put(next_queue, next_stage, seq, _SKIPPED)
+
+    def _put(self, queue: Queue, stage: Stage, seq: int, item):
+        """Queue an item for a stage, waiting for room in the memory budget"""
+        size = self.sizeof(item) if self.memory_budget and item is not _SKIPPED else 0
+
+        if size:
+            i = self._index[stage.name]
+            with self._budget:  # A single item larger than the budget may go when nothing else is queued
+                self._budget.wait_for(
+                    lambda: not sum(self._stage_bytes[i:]) or sum(self._stage_bytes[i:]) + size <= self.memory_budget,
+                )
+                self._stage_bytes[i] += size
+                self._queued_bytes += size
+
+        queue.put((seq, item, size))
+
+        with self._lock:
+            metrics = self.metrics[stage.name]
+            metrics['queued'] = queue.qsize()
+            metrics['max_queued'] = max(metrics['max_queued'], metrics['queued'])
+
+    def _admit(self):
+        """Wait to feed an item while the items held back by ordered stages use up the memory budget"""
+        if self.memory_budget:
+            with self._budget:
+                self._budget.wait_for(lambda: not self._held_bytes or self._queued_bytes < self.memory_budget)
+
+    def _hold(self, stage: Stage, size: int):
+        """Mark the size of an item held back by an ordered stage, still in the memory budget"""
+        if size:
+            with self._budget:
+                self._stage_bytes[self._index[stage.name]] -= size
+                self._held_bytes += size
+                self._budget.notify_all()
+
+    def _release(self, stage: Stage, size: int, held: bool = False):
+        """Return the size of a dequeued (or `held` back) item to the memory budget"""
+        if size:
+            with self._budget:
+                self._queued_bytes -= size
+                if held:
+                    self._held_bytes -= size
+                else:
+                    self._stage_bytes[self._index[stage.name]] -= size
+                self._budget.notify_all()
+
+        with self._lock:
+            self.metrics[stage.name]['queued'] = max(0, self.metrics[stage.name]['queued'] - 1)
+
+    @staticmethod
+    def sizeof(item) -> int:
+        """Estimate the memory used by an item, in bytes
+
+        Args:
+            item: A dict (its values are summed), bytes, a pandas or Polars DataFrame, or an Arrow table.
+                Other objects count as 0.
+
+        Returns:
+            (int): The estimated size
+        """
+        if isinstance(item, dict):
+            return sum(Pipeline.sizeof(v) for v in item.values())
+
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            return len(item)
+
+        if hasattr(item, 'memory_usage'):  # pandas
+            return int(item.memory_usage(deep=True).sum())
+
+        if hasattr(item, 'estimated_size'):  # Polars
+            return int(item.estimated_size())
+
+        if hasattr(item, 'nbytes'):  # Arrow (DuckDB engine)
+            return int(item.nbytes)
+
+        return 0
@@ -2,12 +2,19 @@
 
 This module stores the transformed data
 """
+import asyncio
+from io import BytesIO
+
+from pandas import concat, read_csv
 from pandas.core.frame import DataFrame
+from fsspec.asyn import AsyncFileSystem
 from fsspec.implementations.local import LocalFileSystem as LocalFS
 from adlfs.spec import AzureBlobFileSystem as AzureFS
 from s3fs.core import S3FileSystem as S3FS
 
+from .Engine import get_engine
 from .FS import FS
+from .Index import Index
 
 
 class Storage:
@@ -19,6 +26,13 @@ class Storage:
             aws_secret_file: str = None,
             aws_key: str = None,
             aws_bucket: str = None,
+            fs_validation_ttl: float = 0,
+            fs_state_file: str = None,
+            engine: str = 'pandas',
+            output_format: str = 'csv',
+            index: bool = True,
+            concurrency: int = 8,
+            log=None,
     ):
         """Initialize Storage with the provided destinations
 
@@ -29,23 +43,67 @@ class Storage:
             aws_secret_file (str, optional): The file having the secret key to a AWS account
             aws_key (str, optional): The key to the AWS account
             aws_bucket (str, optional): The bucket in AWS S3
+            fs_validation_ttl (float, optional): Seconds to trust a storage location validation (see FS)
+            fs_state_file (str, optional): File to remember storage location validations between runs (see FS)
+            engine (str, optional): The dataframe engine to serialize with: 'pandas', 'polars' or 'duckdb'
+            output_format (str, optional): One of 'csv' or 'parquet'
+            index (bool, optional): Store a sidecar index with each file, to `lookup` instruments by Id
+            concurrency (int, optional): Concurrent uploads to each storage, with `upload_async`
+            log (logging.Logger, optional): The logger to report to
         """
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError(f'Output format not recognized: {output_format!r}')
+
+        self.engine = get_engine(engine)
+        self.output_format = output_format
+        self.index = index
+        self.concurrency = max(1, concurrency)
+        self.log = log
         self.file_systems = []
+        self._connections = []
+        self._indexes = {}
+        self._limits = {}
+        self.fs = FS(validation_ttl=fs_validation_ttl, state_file=fs_state_file, log=log)
 
         if local_dir:
-            fs = FS().connect(local_dir=local_dir)
-            self.file_systems.append((fs, local_dir))
+            self._connect(local_dir, local_dir=local_dir)
 
         if all([azure_conn_string_file, azure_container]):
-            fs = FS().connect(
+            self._connect(
+                azure_container,
                 azure_container=azure_container,
                 azure_conn_string_file=azure_conn_string_file,
             )
-            self.file_systems.append((fs, azure_container))
 
         if all([aws_secret_file, aws_key]):
-            fs = FS().connect(aws_bucket=aws_bucket, aws_secret_file=aws_secret_file, aws_key=aws_key)
-            self.file_systems.append((fs, aws_bucket))
+            self._connect(aws_bucket, aws_bucket=aws_bucket, aws_secret_file=aws_secret_file, aws_key=aws_key)
+
+    def _connect(self, location: str, **kwargs):
+        """Connect to a storage, and remember how to connect to it again (see `_reconnect`)"""
+        self.file_systems.append((self.fs.connect(**kwargs), location))
+        self._connections.append(kwargs)
+
+    def _reconnect(self, fs: (LocalFS, AzureFS, S3FS), location: str) -> (None, LocalFS, AzureFS, S3FS):
+        """Invalidate a storage after a failed write, and connect to it again for the next writes
+
+        If it cannot be connected yet, the storage is kept as is, and the next failed write tries again.
+
+        Returns:
+            (None, LocalFS, AzureFS, S3FS): The reconnected file system, or None if it could not be connected
+        """
+        self.fs.invalidate(fs, location=location)
+
+        for i, (connected, _) in enumerate(self.file_systems):
+            if connected is fs:
+                try:
+                    self.file_systems[i] = (self.fs.connect(**self._connections[i]), location)
+                except Exception as e:
+                    if self.log:
+                        self.log.error(f'Could not reconnect to the storage {location}. See logs for details.')
+                        self.log.debug(e)
+                    return
+
+                return self.file_systems[i][0]
 
     @staticmethod
     def store_csv(df: DataFrame, fs: (LocalFS, AzureFS, S3FS), file_path: str):
@@ -62,3 +120,231 @@ class Storage:
             df.to_csv(f, index=False)
 
         # needs to handle exceptions and report back success or errors
+
+    def serialize(self, package: dict) -> dict:
+        """Serialize a transformed package as CSV or Parquet (pipeline stage)
+
+        Args:
+            package (dict): Having the transformed `df` frame, from this Storage's engine
+
+        Returns:
+            (dict): The package, with the serialized `data` bytes in place of its `df`, and its sidecar `index`
+        """
+        df = package.pop('df')
+        package['data'] = self.engine.write(df, self.output_format)
+
+        if self.index:
+            package['index'] = Index.build(self.engine.column(df, 'Id'), package['data'], self.output_format)
+
+        return package
+
+    def upload(self, package: dict) -> dict:
+        """Store a serialized package in all available storages (pipeline stage)
+
+        A storage failing to write is invalidated (see FS.invalidate) and reconnected, and the write is tried
+        once again on the new connection, before the next storages.
+
+        The sidecar index, if any, is stored after the data file, so it never points to a missing file.
+
+        Args:
+            package (dict): Having the serialized `data` bytes, the `filename` to store them as, and its `index`
+
+        Returns:
+            (dict): The package, with the `stored` file paths and without its `data` and `index`
+
+        Raises:
+            OSError: If any storage failed, after trying all of them
+        """
+        data = package.pop('data')
+        index = package.pop('index', None)
+        package['stored'] = []
+        failed = []
+
+        for fs, location in list(self.file_systems):
+            file_path = '{}/{}'.format(location, package['filename'])
+
+            try:
+                self._store(fs, file_path, data, index)
+
+            except Exception as e:
+                if (reconnected := self._reconnect(fs, location)) is None:
+                    failed.append(f'{file_path} ({fs.protocol}): {e}')
+                    continue
+
+                try:
+                    self._store(reconnected, file_path, data, index)
+
+                except Exception as e:
+                    failed.append(f'{file_path} ({fs.protocol}): {e}')
+                    continue
+
+            package['stored'].append(file_path)
+
+        if failed:
+            raise OSError('Could not store {}'.format('; '.join(failed)))
+
+        return package
+
+    async def upload_async(self, package: dict) -> dict:
+        """Store a serialized package in all available storages concurrently (asyncio pipeline stage, see `upload`)
+
+        S3 and Azure are written with the coroutines of their fsspec async file systems, without a thread per
+        transfer; the local file system is written in a thread. Each storage takes `concurrency` uploads at once.
+
+        Args:
+            package (dict): Having the serialized `data` bytes, the `filename` to store them as, and its `index`
+
+        Returns:
+            (dict): The package, with the `stored` file paths and without its `data` and `index`
+
+        Raises:
+            OSError: If any storage failed, after trying all of them
+        """
+        data = package.pop('data')
+        index = package.pop('index', None)
+        file_systems = list(self.file_systems)
+        file_paths = ['{}/{}'.format(location, package['filename']) for _, location in file_systems]
+
+        results = await asyncio.gather(
+            *(
+                self._store_async(fs, location, file_path, data, index)
+                for (fs, location), file_path in zip(file_systems, file_paths)
+            ),
+            return_exceptions=True,
+        )
+
+        package['stored'] = []
+        failed = []
+
+        retries = {}
+        for i, ((fs, location), result) in enumerate(zip(file_systems, results)):
+            if isinstance(result, Exception) and (reconnected := self._reconnect(fs, location)) is not None:
+                retries[i] = self._store_async(reconnected, location, file_paths[i], data, index)
+
+        for i, result in zip(retries, await asyncio.gather(*retries.values(), return_exceptions=True)):
+            results[i] = result
+
+        for (fs, location), file_path, result in zip(file_systems, file_paths, results):
+            if isinstance(result, Exception):
+                failed.append(f'{file_path} ({fs.protocol}): {result}')
+                continue
+
+            package['stored'].append(file_path)
+
+        if failed:
+            raise OSError('Could not store {}'.format('; '.join(failed)))
+
+        return package
+
+    @staticmethod
+    def _store(fs: (LocalFS, AzureFS, S3FS), file_path: str, data: bytes, index):
+        """Write a data file, then its sidecar index"""
+        with fs.open(file_path, 'wb') as f:
+            f.write(data)
+
+        if index is not None:
+            with fs.open(file_path + Index.SUFFIX, 'wb') as f:
+                f.write(index)
+
+    async def _store_async(self, fs: (LocalFS, AzureFS, S3FS), location: str, file_path: str, data: bytes, index):
+        """Write a data file, then its sidecar index, within the storage's concurrency limit"""
+        loop = asyncio.get_running_loop()
+        limit = self._limits.get(location)
+
+        if limit is None or limit[0] is not loop:  # Semaphores are bound to the event loop they are used in
+            limit = self._limits[location] = (loop, asyncio.Semaphore(self.concurrency))
+
+        async with limit[1]:
+            await self._pipe_file(fs, file_path, data)
+
+            if index is not None:
+                await self._pipe_file(fs, file_path + Index.SUFFIX, index)
+
+    @staticmethod
+    async def _pipe_file(fs: (LocalFS, AzureFS, S3FS), file_path: str, data: bytes):
+        """Write a file with the file system coroutine if it is async (S3, Azure), else in a thread"""
+        if not isinstance(fs, AsyncFileSystem):
+            return await asyncio.to_thread(fs.pipe_file, file_path, data)
+
+        if fs.asynchronous:
+            return await fs._pipe_file(file_path, data)
+
+        # A file system connected for sync use runs its coroutines in the fsspec IO loop: await them from there
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(fs._pipe_file(file_path, data), fs.loop))
+
+    def lookup(self, ids: list) -> DataFrame:
+        """Find the stored records of instruments, by Id
+
+        Only the stored files having a sidecar index are searched. For each of them, the index fences
+        (kept in memory after the first lookup), the index pages and the matching rows are read with
+        range requests, so a lookup costs a few KB of I/O per file instead of a full scan.
+
+        Args:
+            ids (list): The instrument Ids to find
+
+        Returns:
+            DataFrame: The matching records, with the `file` they are stored in, by file name and row order
+
+        Raises:
+            ValueError: If no storage is enabled
+        """
+        if not self.file_systems:
+            raise ValueError('No storage enabled')
+
+        fs, location = self.file_systems[0]  # All storages hold the same files: read from the first one
+        ids = list(ids)
+        hashes = Index.hash(ids)
+        frames = []
+
+        for index_path, info in sorted(fs.glob(f'{location}/data.*{Index.SUFFIX}', detail=True).items()):
+            file_path = index_path[:-len(Index.SUFFIX)]
+            # A compacted file, and its sidecar index, may be rewritten in place (see Compactor)
+            version = (
+                info.get('size'),
+                info.get('mtime') or info.get('LastModified') or info.get('last_modified'),
+                info.get('ETag') or info.get('etag'),
+            )
+            cached = self._indexes.get(index_path)
+            if cached is None or cached[0] != version:
+                cached = self._indexes[index_path] = (version, Index(fs, index_path))
+
+            index = cached[1]
+            records = index.find(hashes)
+
+            if not len(records):
+                continue
+
+            if file_path.endswith('.parquet'):
+                df = self._read_parquet_rows(fs, file_path, records)
+            else:
+                df = self._read_csv_rows(fs, file_path, index.header_length, records)
+
+            df = df[df['Id'].isin(ids)]  # Drop the rows matching by hash collision only
+            frames.append(df.assign(file=file_path))
+
+        return concat(frames, ignore_index=True) if frames else DataFrame()
+
+    @staticmethod
+    def _read_csv_rows(fs: (LocalFS, AzureFS, S3FS), file_path: str, header_length: int, records) -> DataFrame:
+        """Read the header and the indexed rows of a stored CSV file, with range requests. Values are read as text."""
+        starts = [0] + [int(offset) for offset in records['offset']]
+        ends = [header_length] + [int(offset + length) for offset, length in records[['offset', 'length']]]
+        chunks = fs.cat_ranges([file_path] * len(starts), starts, ends, on_error='raise')
+
+        return read_csv(BytesIO(b''.join(chunks)), dtype=str, keep_default_na=False)
+
+    @staticmethod
+    def _read_parquet_rows(fs: (LocalFS, AzureFS, S3FS), file_path: str, records) -> DataFrame:
+        """Read the row groups having the indexed rows of a stored Parquet file, with range requests"""
+        # Optional dependency, required to read Parquet (the `parquet` extra)
+        from pyarrow.parquet import ParquetFile
+
+        frames = []
+        with fs.open(file_path, 'rb') as f:
+            parquet_file = ParquetFile(f)
+
+            for row_group in sorted(set(records['offset'])):
+                rows = records['length'][records['offset'] == row_group].astype(int)
+                frames.append(parquet_file.read_row_group(int(row_group)).to_pandas().iloc[rows])
+
+        return concat(frames, ignore_index=True)
@@ -2,13 +2,26 @@
 
 This module handles transformation of data
 """
-from numpy import where
 from pandas.core.frame import DataFrame
 
+from .Engine import PandasEngine, get_engine
+
 
 class Transformer:
-    def __init__(self):
-        pass
+    """The Transformer
+
+    Transformations are registered by name in `TRANSFORMS`, and each dataframe engine implements them.
+    """
+
+    TRANSFORMS = ('create_derived_columns',)
+
+    def __init__(self, engine: str = 'pandas'):
+        """Initialize the Transformer
+
+        Args:
+            engine (str, optional): The dataframe engine to transform with: 'pandas', 'polars' or 'duckdb'
+        """
+        self.engine = get_engine(engine)
 
     @staticmethod
     def create_derived_columns(df: DataFrame):
@@ -24,5 +37,21 @@ class Transformer:
         Returns:
             None: The DataFrame is modified in place, so there is no need to return it
         """
-        df['a_count'] = df['FullNm'].str.count('a').fillna(0)
-        df['contains_a'] = where(df['a_count'] > 0, 'YES', 'NO')
+        PandasEngine.create_derived_columns(df)
+
+    def transform(self, package: dict) -> dict:
+        """Transform a parsed package (pipeline stage)
+
+        Args:
+            package (dict): Having the parsed pandas `df` DataFrame
+
+        Returns:
+            (dict): The package, with its `df` converted to the engine's frame and all transformations applied
+        """
+        df = self.engine.from_pandas(package['df'])
+
+        for name in self.TRANSFORMS:
+            df = getattr(self.engine, name)(df)
+
+        package['df'] = df
+        return package
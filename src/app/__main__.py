@@ -1,9 +1,17 @@
 """Application main file"""
+import asyncio
+import sys
+from argparse import ArgumentParser
 from datetime import datetime as _dt
+from functools import partial
+
+import aiohttp
+import requests
 from requests.exceptions import ConnectionError, HTTPError
 
 from .config import (
     PROJECT_NAME,
+    PROJECT_DESCRIPTION,
     LOGS_DIR,
     LOG_LEVEL,
     LOG_MAX_ROTATED_FILES,
@@ -13,21 +21,78 @@ from .config import (
     APP_VERSION,
     SOURCE_XML_URL,
     DOWNLOAD_LINK_INDEX,
+    DOWNLOAD_DIR,
+    DOWNLOAD_KEEP_FILES,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_PARTS,
+    DOWNLOAD_MIN_PART_MB,
+    PARSE_PROCESSES,
+    PARSE_SHARD_MB,
     STORAGE_LOCAL_DIR,
     STORAGE_AZURE_CONNECTION_STRING_FILEPATH,
     STORAGE_AZURE_CONTAINER_NAME,
     STORAGE_AWS_SECRET_FILEPATH,
     STORAGE_AWS_KEY_STRING,
     STORAGE_AWS_BUCKET_NAME,
+    FS_VALIDATION_TTL_SECONDS,
+    FS_STATE_FILEPATH,
+    SERVE_POLL_INTERVAL_SECONDS,
+    SERVE_POLL_JITTER_SECONDS,
+    SERVE_MAX_BACKOFF_SECONDS,
+    SERVE_STATE_FILEPATH,
+    PIPELINE_MEMORY_BUDGET_MB,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_DOWNLOAD_WORKERS,
+    PIPELINE_PARSE_WORKERS,
+    PIPELINE_TRANSFORM_WORKERS,
+    PIPELINE_SERIALIZE_WORKERS,
+    PIPELINE_UPLOAD_WORKERS,
+    PIPELINE_ASYNC,
+    PIPELINE_ASYNC_MAX_PACKAGES,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    STORAGE_CONCURRENCY,
+    DEDUP_ENABLED,
+    DEDUP_MAX_MEMORY_KEYS,
+    DEDUP_SPILL_DIR,
+    COMPACT_PERIOD,
+    COMPACT_GRACE_HOURS,
+    COMPACT_RETENTION_DAYS,
+    COMPACT_READ_WORKERS,
+    DATAFRAME_ENGINE,
+    STORAGE_FORMAT,
+    STORAGE_INDEX_ENABLED,
 )
 from .Logger import Logger
+from .Downloader import Downloader
 from .Extractor import Extractor
 from .Transformer import Transformer
 from .Storage import Storage
+from .Daemon import Daemon
+from .Deduplicator import Deduplicator
+from .Compactor import Compactor
+from .Pipeline import Pipeline, Stage
+from .AsyncPipeline import AsyncPipeline
+
 
+def main(argv: list = None):
+    """Application main method or entry point
+
+    Args:
+        argv (list, optional): Command line arguments. Defaults to sys.argv.
+    """
+    parser = ArgumentParser(prog='app', description=PROJECT_DESCRIPTION)
+    parser.add_argument(
+        'command', nargs='?', choices=('run', 'serve', 'lookup', 'compact'), default='run',
+        help='run once (default), serve: keep polling for new packages, lookup: print the stored records of ids, '
+             'or compact: merge and expire the stored files',
+    )
+    parser.add_argument(
+        'values', nargs='*', metavar='value',
+        help='instrument ids, for lookup, or package paths or URLs (i.e. file://, s3://), to run instead of fetching',
+    )
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
 
-def main():
-    """Application main method or entry point"""
     obj = Logger(
         name=PROJECT_NAME,
         logs_dir=LOGS_DIR,
@@ -39,41 +104,355 @@ def main():
     log = obj.logger
     log.info('{s}- Start {a} v{v} {s}-'.format(s='-*' * 5, a=APP_NAME, v=APP_VERSION))
 
-    extractor = Extractor()
+    if args.command == 'serve':
+        serve(log)
+        return
+
+    if args.command == 'lookup':
+        lookup(args.values, log)
+        return
+
+    if args.command == 'compact':
+        compact(log)
+        return
+
+    if PIPELINE_ASYNC:
+        asyncio.run(run_async(log, package_urls=args.values))
+        return
+
+    extractor = create_extractor()
+    package_urls = args.values
 
     try:
-        package_url = extractor.fetch_package_url(source_xml_url=SOURCE_XML_URL, link_index=DOWNLOAD_LINK_INDEX)
+        if not package_urls:
+            package_url = extractor.fetch_package_url(source_xml_url=SOURCE_XML_URL, link_index=DOWNLOAD_LINK_INDEX)
+            package_urls = [package_url] if package_url else []
 
     except (ConnectionError, HTTPError) as e:
         log.error('Could not fetch file - Update the SOURCE_XML_URL var in env.toml and/or .env. See logs for details.')
         log.debug(e)
+        extractor.close()
+        return
+
+    if not package_urls:
+        log.error(f'No DLTINS file at DOWNLOAD_LINK_INDEX {DOWNLOAD_LINK_INDEX}')
+        extractor.close()
+        return
+
+    storage = connect_storage(log)
+
+    if not storage.file_systems:
+        log.error('No storage enabled')
+        return
+
+    try:
+        run_pipeline(package_urls, extractor=extractor, storage=storage, log=log)
+
+    finally:
+        extractor.close()
+
+
+async def run_async(log, package_urls: list = None):
+    """Run once in asyncio mode: fetch the result pages concurrently, then run the pipeline as asyncio tasks
 
-    log.debug(f'Parse data from {package_url=}')
-    df = extractor.parse_package_content(package_url=package_url)
-    log.info(f'Parsed {len(df)} data record(s)')
+    Args:
+        log (logging.Logger): The application logger
+        package_urls (list, optional): The package paths or URLs to run, instead of fetching them
+    """
+    extractor = create_extractor()
 
-    Transformer().create_derived_columns(df)
+    try:
+        async with create_http_session() as http:
+            try:
+                if not package_urls:
+                    package_urls = await extractor.fetch_package_urls_async(
+                        http, source_xml_url=SOURCE_XML_URL, min_urls=DOWNLOAD_LINK_INDEX + 1,
+                    )
+                    package_urls = package_urls[DOWNLOAD_LINK_INDEX:DOWNLOAD_LINK_INDEX + 1]
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.error(
+                    'Could not fetch file - Update the SOURCE_XML_URL var in env.toml and/or .env. '
+                    'See logs for details.',
+                )
+                log.debug(e)
+                return
+
+            if not package_urls:
+                log.error(f'No DLTINS file at DOWNLOAD_LINK_INDEX {DOWNLOAD_LINK_INDEX}')
+                return
+
+            storage = connect_storage(log)
+
+            if not storage.file_systems:
+                log.error('No storage enabled')
+                return
+
+            await run_pipeline_async(package_urls, extractor, storage, log, http=http)
+
+    finally:
+        extractor.close()
+
+
+def serve(log):
+    """Keep a warm process polling for new packages, until SIGTERM
+
+    The HTTP session, the Logger and the storage connections are created once and reused by every run.
+    With PIPELINE_ASYNC, each run has its own event loop and asyncio HTTP session.
+
+    Args:
+        log (logging.Logger): The application logger
+    """
+    storage = connect_storage(log)
+
+    if not storage.file_systems:
+        log.error('No storage enabled')
+        return
+
+    with requests.Session() as session:
+        extractor = create_extractor(session=session)
+
+        def run(package_urls: list) -> list:
+            if PIPELINE_ASYNC:
+                return asyncio.run(run_pipeline_async(
+                    package_urls, extractor=extractor, storage=storage, log=log, stopping=lambda: daemon.stopping,
+                ))
+
+            return run_pipeline(
+                package_urls, extractor=extractor, storage=storage, log=log, stopping=lambda: daemon.stopping,
+            )
+
+        daemon = Daemon(
+            poll=lambda: extractor.fetch_package_urls(source_xml_url=SOURCE_XML_URL),
+            run=run,
+            interval=SERVE_POLL_INTERVAL_SECONDS,
+            jitter=SERVE_POLL_JITTER_SECONDS,
+            max_backoff=SERVE_MAX_BACKOFF_SECONDS,
+            state_file=SERVE_STATE_FILEPATH,
+            log=log,
+        )
+        log.info(f'Serving: poll every {SERVE_POLL_INTERVAL_SECONDS}s, {len(daemon.seen)} package(s) already handled')
+
+        try:
+            daemon.serve()
 
-    storage = Storage(
+        finally:
+            extractor.close()
+
+    log.info('Stopped serving')
+
+
+def lookup(ids: list, log):
+    """Print the stored records of instruments as CSV, found with the sidecar indexes
+
+    Args:
+        ids (list): The instrument Ids to find
+        log (logging.Logger): The application logger
+    """
+    storage = connect_storage(log)
+
+    if not storage.file_systems:
+        log.error('No storage enabled')
+        return
+
+    df = storage.lookup(ids)
+    log.info(f'Found {len(df)} record(s) for {len(ids)} id(s)')
+    df.to_csv(sys.stdout, index=False)
+
+
+def compact(log):
+    """Merge the files stored by each run into daily or monthly files, and remove the expired ones
+
+    Args:
+        log (logging.Logger): The application logger
+    """
+    storage = connect_storage(log)
+
+    if not storage.file_systems:
+        log.error('No storage enabled')
+        return
+
+    compactor = Compactor(
+        storage,
+        period=COMPACT_PERIOD,
+        grace_hours=COMPACT_GRACE_HOURS,
+        retention_days=COMPACT_RETENTION_DAYS,
+        read_workers=COMPACT_READ_WORKERS,
+        dedup=DEDUP_ENABLED,
+        log=log,
+    )
+    totals = compactor.run()
+    log.info('Compaction done: {compacted} file(s) written from {merged}, {expired} expired'.format(**totals))
+
+
+def create_extractor(session: requests.Session = None) -> Extractor:
+    """Create the extractor, with its downloader, as set in the configuration"""
+    downloader = Downloader(
+        session=session,
+        download_dir=DOWNLOAD_DIR,
+        retries=DOWNLOAD_RETRIES,
+        parts=DOWNLOAD_PARTS,
+        min_part_mb=DOWNLOAD_MIN_PART_MB,
+    )
+    return Extractor(
+        session=session,
+        downloader=downloader,
+        keep_downloads=DOWNLOAD_KEEP_FILES,
+        parse_processes=PARSE_PROCESSES,
+        shard_mb=PARSE_SHARD_MB,
+    )
+
+
+def connect_storage(log=None) -> Storage:
+    """Connect to all the storages enabled in the configuration"""
+    return Storage(
         local_dir=STORAGE_LOCAL_DIR,
         azure_conn_string_file=STORAGE_AZURE_CONNECTION_STRING_FILEPATH,
         azure_container=STORAGE_AZURE_CONTAINER_NAME,
         aws_secret_file=STORAGE_AWS_SECRET_FILEPATH,
         aws_key=STORAGE_AWS_KEY_STRING,
         aws_bucket=STORAGE_AWS_BUCKET_NAME,
+        fs_validation_ttl=FS_VALIDATION_TTL_SECONDS,
+        fs_state_file=FS_STATE_FILEPATH,
+        engine=DATAFRAME_ENGINE,
+        output_format=STORAGE_FORMAT,
+        index=STORAGE_INDEX_ENABLED,
+        concurrency=STORAGE_CONCURRENCY,
+        log=log,
     )
 
-    if not storage.file_systems:
-        log.error('No storage enabled')
-        return
 
-    filename = 'data.{}Z.csv'.format(_dt.utcnow().strftime('%Y%m%d-%H%M'))
-    log.info(f'Request storage for: {filename}')
+def run_pipeline(package_urls: list, extractor: Extractor, storage: Storage, log, stopping: callable = None) -> list:
+    """Download, parse, deduplicate, transform, serialize and upload packages, as concurrent stages
+
+    Packages are fed newest first (by publication date and part), so that deduplication by Id keeps
+    the last written record of each instrument.
+
+    Args:
+        package_urls (list): The URLs to the ZIP packages containing the XML data files
+        extractor (Extractor): The extractor to fetch the packages with
+        storage (Storage): The connected storages
+        log (logging.Logger): The application logger
+        stopping (callable, optional): Returns True to feed no more packages
+
+    Returns:
+        (list): The URLs of the packages stored in all the storages
+    """
+    deduplicator = Deduplicator(max_memory_keys=DEDUP_MAX_MEMORY_KEYS, spill_dir=DEDUP_SPILL_DIR)
+    stages = create_stages(extractor.download, extractor, deduplicator, storage, storage.upload)
+    pipeline = Pipeline(stages=stages, memory_budget_mb=PIPELINE_MEMORY_BUDGET_MB, log=log)
+
+    try:
+        stored = pipeline.run(feed_packages(package_urls, storage, log, stopping=stopping))
+
+    finally:
+        deduplicator.close()
+
+    return report_stored(stored, log)
+
+
+async def run_pipeline_async(
+        package_urls: list,
+        extractor: Extractor,
+        storage: Storage,
+        log,
+        stopping: callable = None,
+        http: aiohttp.ClientSession = None,
+) -> list:
+    """Run the pipeline (see `run_pipeline`) as asyncio tasks
+
+    Downloads and uploads are coroutines, limited per HTTP host and per storage; the other stages run in
+    an executor.
+
+    Args:
+        package_urls (list): The URLs to the ZIP packages containing the XML data files
+        extractor (Extractor): The extractor to fetch the packages with
+        storage (Storage): The connected storages
+        log (logging.Logger): The application logger
+        stopping (callable, optional): Returns True to feed no more packages
+        http (aiohttp.ClientSession, optional): The asyncio HTTP session. Defaults to a new one.
+
+    Returns:
+        (list): The URLs of the packages stored in all the storages
+    """
+    if http is None:
+        async with create_http_session() as http:
+            return await run_pipeline_async(package_urls, extractor, storage, log, stopping=stopping, http=http)
+
+    deduplicator = Deduplicator(max_memory_keys=DEDUP_MAX_MEMORY_KEYS, spill_dir=DEDUP_SPILL_DIR)
+    download = partial(extractor.download_async, http=http)
+    stages = create_stages(download, extractor, deduplicator, storage, storage.upload_async)
+    pipeline = AsyncPipeline(stages=stages, max_in_flight=PIPELINE_ASYNC_MAX_PACKAGES, log=log)
+
+    try:
+        stored = await pipeline.run(feed_packages(package_urls, storage, log, stopping=stopping))
+
+    finally:
+        deduplicator.close()
+
+    return report_stored(stored, log)
+
+
+def create_stages(
+        download: callable,
+        extractor: Extractor,
+        deduplicator: Deduplicator,
+        storage: Storage,
+        upload: callable,
+) -> list:
+    """Create the pipeline stages, as set in the configuration"""
+    stages = [
+        Stage('download', download, workers=PIPELINE_DOWNLOAD_WORKERS),
+        Stage('parse', extractor.parse, workers=PIPELINE_PARSE_WORKERS),
+        Stage('dedup', deduplicator.dedup, ordered=True),
+        Stage('transform', Transformer(engine=DATAFRAME_ENGINE).transform, workers=PIPELINE_TRANSFORM_WORKERS),
+        Stage('serialize', storage.serialize, workers=PIPELINE_SERIALIZE_WORKERS),
+        Stage('upload', upload, workers=PIPELINE_UPLOAD_WORKERS),
+    ]
+    if not DEDUP_ENABLED:
+        stages.pop(2)
+
+    for stage in stages:
+        stage.queue_size = PIPELINE_QUEUE_SIZE
+
+    return stages
+
+
+def feed_packages(package_urls: list, storage: Storage, log, stopping: callable = None):
+    """Yield the packages to run, newest first, named after the run time
+
+    Args:
+        package_urls (list): The URLs to the ZIP packages containing the XML data files
+        storage (Storage): The connected storages
+        log (logging.Logger): The application logger
+        stopping (callable, optional): Returns True to feed no more packages
+    """
+    timestamp = _dt.utcnow().strftime('%Y%m%d-%H%M')
+
+    for i, package_url in enumerate(sorted(package_urls, key=Deduplicator.package_order, reverse=True)):
+        if stopping and stopping():
+            return
+
+        filename = Compactor.run_file_name(timestamp, i, storage.output_format)
+        log.debug(f'Request {package_url=} as {filename}')
+        yield {'url': package_url, 'filename': filename}
+
+
+def report_stored(stored: list, log) -> list:
+    """Log the stored packages, and return their URLs"""
+    for package in stored:
+        log.info('Stored {}{}'.format(
+            ', '.join(package['stored']),
+            ' ({} duplicate record(s) dropped)'.format(package['duplicates']) if package.get('duplicates') else '',
+        ))
+
+    return [package['url'] for package in stored]
+
 
-    for fs, location in storage.file_systems:
-        file_path = '{}/{}'.format(location, filename)
-        log.info(f'Request {fs.protocol} storage')
-        storage.store_csv(df=df, fs=fs, file_path=file_path)
+def create_http_session() -> aiohttp.ClientSession:
+    """Create the asyncio HTTP session, with the connection limits set in the configuration"""
+    connector = aiohttp.TCPConnector(limit=HTTP_MAX_CONNECTIONS, limit_per_host=HTTP_MAX_CONNECTIONS_PER_HOST)
+    return aiohttp.ClientSession(connector=connector)
 
 
 if __name__ == '__main__':
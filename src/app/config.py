@@ -13,6 +13,7 @@ Regarding decouple, the dependency responsible for fetching environment variable
 - command-line variable > .env file > fallback value (if set)
 """
 from decouple import config
+from os import cpu_count
 from pathlib import Path
 from tempfile import gettempdir
 
@@ -34,10 +35,54 @@ PROJECT_ROOT_DIR: Path = SRC_BASE_DIR.parent
 
 SOURCE_XML_URL: str = config('SOURCE_XML_URL')
 DOWNLOAD_LINK_INDEX: int = config('DOWNLOAD_LINK_INDEX', cast=int, default=1)
+DOWNLOAD_DIR: Path = Path(config('DOWNLOAD_DIR', default=f'/{gettempdir()}/{PROJECT_NAME}/downloads')).resolve()
+DOWNLOAD_KEEP_FILES: bool = config('DOWNLOAD_KEEP_FILES', cast=bool, default=False)
+DOWNLOAD_RETRIES: int = config('DOWNLOAD_RETRIES', cast=int, default='5')
+DOWNLOAD_PARTS: int = config('DOWNLOAD_PARTS', cast=int, default='1')
+DOWNLOAD_MIN_PART_MB: float = config('DOWNLOAD_MIN_PART_MB', cast=float, default='8')
+PARSE_PROCESSES: int = config('PARSE_PROCESSES', cast=int, default=str(cpu_count() or 1))
+PARSE_SHARD_MB: float = config('PARSE_SHARD_MB', cast=float, default='16')
 
+DATAFRAME_ENGINE: str = config('DATAFRAME_ENGINE', default='pandas')
+STORAGE_FORMAT: str = config('STORAGE_FORMAT', default='csv')
+STORAGE_INDEX_ENABLED: bool = config('STORAGE_INDEX_ENABLED', cast=bool, default=True)
 STORAGE_LOCAL_DIR: str = config('STORAGE_LOCAL_DIR', default=None)
 STORAGE_AZURE_CONNECTION_STRING_FILEPATH: str = config('STORAGE_AZURE_CONNECTION_STRING_FILEPATH', default=None)
 STORAGE_AZURE_CONTAINER_NAME: str = config('STORAGE_AZURE_CONTAINER_NAME', default=None)
 STORAGE_AWS_SECRET_FILEPATH: str = config('STORAGE_AWS_SECRET_FILEPATH', default=None)
 STORAGE_AWS_KEY_STRING: str = config('STORAGE_AWS_KEY_STRING', default=None)
 STORAGE_AWS_BUCKET_NAME: str = config('STORAGE_AWS_BUCKET_NAME', default=None)
+
+FS_VALIDATION_TTL_SECONDS: float = config('FS_VALIDATION_TTL_SECONDS', cast=float, default='3600')
+FS_STATE_FILEPATH: Path = Path(
+    config('FS_STATE_FILEPATH', default=f'/{gettempdir()}/{PROJECT_NAME}/fs-state.json'),
+).resolve()
+
+SERVE_POLL_INTERVAL_SECONDS: float = config('SERVE_POLL_INTERVAL_SECONDS', cast=float, default='900')
+SERVE_POLL_JITTER_SECONDS: float = config('SERVE_POLL_JITTER_SECONDS', cast=float, default='60')
+SERVE_MAX_BACKOFF_SECONDS: float = config('SERVE_MAX_BACKOFF_SECONDS', cast=float, default='3600')
+SERVE_STATE_FILEPATH: Path = Path(
+    config('SERVE_STATE_FILEPATH', default=f'/{gettempdir()}/{PROJECT_NAME}/serve-state.json'),
+).resolve()
+
+PIPELINE_MEMORY_BUDGET_MB: float = config('PIPELINE_MEMORY_BUDGET_MB', cast=float, default='512')
+PIPELINE_QUEUE_SIZE: int = config('PIPELINE_QUEUE_SIZE', cast=int, default='2')
+PIPELINE_DOWNLOAD_WORKERS: int = config('PIPELINE_DOWNLOAD_WORKERS', cast=int, default='2')
+PIPELINE_PARSE_WORKERS: int = config('PIPELINE_PARSE_WORKERS', cast=int, default='2')
+PIPELINE_TRANSFORM_WORKERS: int = config('PIPELINE_TRANSFORM_WORKERS', cast=int, default='1')
+PIPELINE_SERIALIZE_WORKERS: int = config('PIPELINE_SERIALIZE_WORKERS', cast=int, default='1')
+PIPELINE_UPLOAD_WORKERS: int = config('PIPELINE_UPLOAD_WORKERS', cast=int, default='2')
+PIPELINE_ASYNC: bool = config('PIPELINE_ASYNC', cast=bool, default=False)
+PIPELINE_ASYNC_MAX_PACKAGES: int = config('PIPELINE_ASYNC_MAX_PACKAGES', cast=int, default='8')
+HTTP_MAX_CONNECTIONS: int = config('HTTP_MAX_CONNECTIONS', cast=int, default='100')
+HTTP_MAX_CONNECTIONS_PER_HOST: int = config('HTTP_MAX_CONNECTIONS_PER_HOST', cast=int, default='8')
+STORAGE_CONCURRENCY: int = config('STORAGE_CONCURRENCY', cast=int, default='8')
+
+DEDUP_ENABLED: bool = config('DEDUP_ENABLED', cast=bool, default=True)
+DEDUP_MAX_MEMORY_KEYS: int = config('DEDUP_MAX_MEMORY_KEYS', cast=int, default='10000000')
+DEDUP_SPILL_DIR: str = config('DEDUP_SPILL_DIR', default=None)
+
+COMPACT_PERIOD: str = config('COMPACT_PERIOD', default='daily')
+COMPACT_GRACE_HOURS: float = config('COMPACT_GRACE_HOURS', cast=float, default='6')
+COMPACT_RETENTION_DAYS: float = config('COMPACT_RETENTION_DAYS', cast=float, default='0')
+COMPACT_READ_WORKERS: int = config('COMPACT_READ_WORKERS', cast=int, default='4')
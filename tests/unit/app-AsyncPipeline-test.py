@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from time import sleep
+
+from app.AsyncPipeline import AsyncPipeline
+from app.Pipeline import Stage
+
+
+def method_run_test():
+    async def double(x):
+        await asyncio.sleep(0.001 * (10 - x))
+        return x * 2
+
+    pipeline = AsyncPipeline([Stage('double', double, workers=3), Stage('add', lambda x: x + 1, workers=2)])
+    assert sorted(asyncio.run(pipeline.run(range(10)))) == [x * 2 + 1 for x in range(10)]
+    assert pipeline.metrics['double']['processed'] == 10
+    assert pipeline.metrics['double']['max_running'] == 3
+    assert pipeline.metrics['add']['processed'] == 10
+
+
+def failed_items_dropped_test():
+    async def fail_on_odd(x):
+        if x % 2:
+            raise ValueError(x)
+        return x
+
+    pipeline = AsyncPipeline([Stage('even', fail_on_odd), Stage('drop_zero', lambda x: x or None)])
+    assert sorted(asyncio.run(pipeline.run(range(6)))) == [2, 4]
+    assert pipeline.metrics['even']['failed'] == 3
+    assert [e[1] for e in pipeline.errors] == [1, 3, 5]
+
+
+def ordered_stage_test():
+    async def unordered(x):
+        await asyncio.sleep(0.001 * (10 - x))
+        if x == 3:
+            return None
+        if x == 5:
+            raise ValueError(x)
+        return x
+
+    handled = []
+    pipeline = AsyncPipeline([
+        Stage('unordered', unordered, workers=4),
+        Stage('ordered', lambda x: handled.append(x) or x, ordered=True),
+    ], max_in_flight=4)
+    asyncio.run(pipeline.run(range(10)))
+    assert handled == [0, 1, 2, 4, 6, 7, 8, 9]
+
+
+def max_in_flight_test():
+    fed = []
+
+    def items():
+        for i in range(20):
+            fed.append(i)
+            yield i
+
+    def slow(x):
+        sleep(0.01)
+        return len(fed) - x
+
+    pipeline = AsyncPipeline([Stage('slow', slow)], max_in_flight=3)
+    assert max(asyncio.run(pipeline.run(items()))) <= 4  # In flight (3), and at the feeder (1)
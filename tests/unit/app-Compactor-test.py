@@ -0,0 +1,124 @@
+import pytest
+from datetime import datetime as _dt
+from tempfile import mkdtemp
+from unittest.mock import patch
+
+from pandas.core.frame import DataFrame
+
+from app.Compactor import Compactor
+from app.Storage import Storage
+
+
+def store(storage: Storage, filename: str, ids: list, name: str):
+    df = DataFrame({'Id': ids, 'FullNm': [f'{name} "{i}",\n' for i in ids]})
+    storage.upload(storage.serialize({'df': df, 'filename': filename}))
+
+
+@pytest.mark.parametrize(
+    'name, expected', (
+            ('data.20241024-1537Z.csv', ('202410241537', 0)),
+            (Compactor.run_file_name('20241024-1537', 2, 'parquet'), ('202410241537', -2)),
+            ('data.20241024Z.csv', ('20241024', 0)),
+            ('data.202410Z.csv', ('202410', 0)),
+    ),
+)
+def method_file_order_test(name, expected):
+    assert Compactor.file_order(name) == expected
+
+
+@pytest.mark.parametrize(
+    'key, expected', (
+            ('20241024', _dt(2024, 10, 25)),
+            ('20241231', _dt(2025, 1, 1)),
+            ('202402', _dt(2024, 3, 1)),
+            ('202412', _dt(2025, 1, 1)),
+    ),
+)
+def method_period_end_test(key, expected):
+    assert Compactor.period_end(key) == expected
+
+
+def method_plan_test():
+    names = [
+        'data.20241023Z.csv', 'data.20241023-2300Z.csv', Compactor.run_file_name('20241024-0100', 1, 'csv'),
+        Compactor.run_file_name('20241024-0100', 0, 'csv'),
+        'data.20241024-0900Z.parquet', 'data.20241025-0100Z.csv', 'data.20241022Z.csv', 'data.202409Z.csv',
+    ]
+    daily = Compactor(Storage(), period='daily', grace_hours=6).plan(names, now=_dt(2024, 10, 25, 6))
+
+    assert daily == {
+        'data.20241023Z.csv': ['data.20241023-2300Z.csv', 'data.20241023Z.csv'],
+        'data.20241024Z.csv': ['data.20241024-0100Z.csv', 'data.20241024-0100.1Z.csv'],
+        'data.20241024Z.parquet': ['data.20241024-0900Z.parquet'],
+    }
+
+    monthly = Compactor(Storage(), period='monthly').plan(names, now=_dt(2024, 11, 1, 6))
+    assert list(monthly) == ['data.202410Z.csv', 'data.202410Z.parquet']
+    assert monthly['data.202410Z.csv'][0] == 'data.20241025-0100Z.csv'
+    assert monthly['data.202410Z.csv'][-1] == 'data.20241022Z.csv'
+
+
+@pytest.mark.parametrize('output_format', ('csv', 'parquet'))
+def method_run_test(output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+
+    location = mkdtemp()
+    storage = Storage(local_dir=location, output_format=output_format)
+    store(storage, f'data.20241024-0100Z.{output_format}', ['A', 'B', 'C'], 'old')
+    store(storage, Compactor.run_file_name('20241024-0100', 1, output_format), ['C', 'E'], 'older')
+    store(storage, f'data.20241024-1200Z.{output_format}', ['B', 'D'], 'new')
+    store(storage, f'data.20241025-0100Z.{output_format}', ['A'], 'recent')
+
+    compactor = Compactor(storage, grace_hours=6, retention_days=0)
+    assert compactor.run(now=_dt(2024, 10, 25, 7)) == {'compacted': 1, 'merged': 3, 'expired': 0}
+
+    fs = storage.file_systems[0][0]
+    assert Compactor.list_files(fs, location) == [
+        f'data.20241024Z.{output_format}', f'data.20241025-0100Z.{output_format}',
+    ]
+    assert sorted(fs.ls(location, detail=False)) == sorted(
+        f'{location}/{name}{suffix}'
+        for name in Compactor.list_files(fs, location) for suffix in ('', '.idx')
+    )
+
+    df = storage.lookup(['A', 'B', 'C', 'D', 'E'])
+    assert df[['Id', 'FullNm']].values.tolist() == [
+        ['B', 'new "B",\n'], ['D', 'new "D",\n'], ['A', 'old "A",\n'], ['C', 'old "C",\n'], ['E', 'older "E",\n'],
+        ['A', 'recent "A",\n'],
+    ]
+
+    # A late file is merged into the compacted file, then everything expires
+    store(storage, f'data.20241024-2330Z.{output_format}', ['C'], 'late')
+    assert compactor.run(now=_dt(2024, 10, 26, 7))['merged'] == 3
+
+    df = storage.lookup(['C'])
+    assert df[['Id', 'FullNm']].values.tolist() == [['C', 'late "C",\n']]
+
+    compactor.retention = Compactor(storage, retention_days=1).retention
+    assert compactor.run(now=_dt(2024, 10, 27, 1))['expired'] == 2
+    assert fs.ls(location, detail=False) == []
+
+
+def method_compact_replaces_index_first_test():
+    location = mkdtemp()
+    storage = Storage(local_dir=location)
+    store(storage, 'data.20241024-0100Z.csv', ['A', 'B'], 'old')
+    compactor = Compactor(storage, grace_hours=6)
+    compactor.run(now=_dt(2024, 10, 25, 7))
+    assert list(storage.lookup(['B'])['FullNm']) == ['old "B",\n']
+
+    fs = storage.file_systems[0][0]
+    target_path = f'{location}/data.20241024Z.csv'
+    mv, moves = fs.mv, []
+
+    def record_mv(path1, path2, **kwargs):
+        moves.append((path2, fs.exists(target_path + '.idx')))
+        return mv(path1, path2, **kwargs)
+
+    store(storage, 'data.20241024-2330Z.csv', ['B'], 'late')
+    with patch.object(fs, 'mv', record_mv):
+        compactor.run(now=_dt(2024, 10, 26, 7))
+
+    assert moves == [(target_path, False), (target_path + '.idx', False)]
+    assert list(storage.lookup(['A', 'B'])['FullNm']) == ['late "B",\n', 'old "A",\n']
@@ -0,0 +1,90 @@
+import pytest
+from tempfile import mkdtemp
+from unittest.mock import MagicMock
+
+from app.Daemon import Daemon
+
+
+@pytest.fixture(scope='function')
+def state_file_var() -> str:
+    return f'{mkdtemp()}/serve-state.json'
+
+
+def method_tick_runs_new_keys_test(state_file_var):
+    handled = []
+    daemon = Daemon(poll=lambda: ['a', 'b'], run=lambda keys: handled.extend(keys) or keys, state_file=state_file_var)
+    daemon.tick()
+    daemon.tick()
+    assert handled == ['a', 'b']
+
+    handled.clear()
+    Daemon(poll=lambda: ['a', 'b', 'c'], run=lambda keys: handled.extend(keys) or keys, state_file=state_file_var).tick()
+    assert handled == ['c']
+
+
+def method_tick_failure_backoff_test():
+    def poll():
+        raise ConnectionError('pytest')
+
+    daemon = Daemon(poll=poll, run=list, interval=10, max_backoff=25)
+    assert daemon.next_delay() == 10
+
+    daemon.tick()
+    assert daemon.failures == 1
+    assert daemon.next_delay() == 20
+
+    daemon.tick()
+    assert daemon.next_delay() == 25
+
+
+def failed_run_is_retried_test():
+    handled = []
+
+    def run(keys):
+        if not handled:
+            handled.append(None)
+            return keys[:1]
+        handled.extend(keys)
+        return keys
+
+    daemon = Daemon(poll=lambda: ['a', 'b'], run=run)
+    daemon.tick()
+    assert daemon.failures == 1
+
+    daemon.tick()
+    assert handled == [None, 'b']
+    assert daemon.failures == 0
+
+
+def method_stop_between_runs_test():
+    handled = []
+
+    def run(keys):
+        for key in keys:
+            if daemon.stopping:
+                break
+            handled.append(key)
+            daemon.stop()
+        return handled
+
+    daemon = Daemon(poll=lambda: ['a', 'b'], run=run)
+    daemon.serve()
+    assert handled == ['a']
+    assert daemon.seen == {'a'}
+
+
+def jitter_test():
+    daemon = Daemon(poll=list, run=list, interval=10, jitter=5)
+    assert all(10 <= daemon.next_delay() <= 15 for _ in range(20))
+
+
+def method_tick_state_save_failed_test():
+    blocker = f'{mkdtemp()}/file'
+    open(blocker, 'w').close()
+    log = MagicMock()
+    daemon = Daemon(poll=lambda: ['a'], run=list, state_file=f'{blocker}/serve-state.json', log=log)
+    daemon.tick()
+
+    assert daemon.seen == {'a'}
+    assert daemon.failures == 0
+    log.warning.assert_called_once()
@@ -0,0 +1,53 @@
+import pytest
+from os import listdir
+from tempfile import mkdtemp
+
+from pandas.core.frame import DataFrame
+
+from app.Deduplicator import Deduplicator
+
+
+@pytest.mark.parametrize(
+    'package_url, expected', (
+            ('https://firds.esma.europa.eu/firds/DLTINS_20210119_02of02.zip', ('20210119', 2)),
+            ('/tmp/downloads/DLTINS_20210117_01of01.zip', ('20210117', 1)),
+            ('http://0.0.0.0:8888/data.xml.zip', ('', 0)),
+    ),
+)
+def method_package_order_test(package_url, expected):
+    assert Deduplicator.package_order(package_url) == expected
+
+
+def method_deduplicate_last_writer_wins_test():
+    obj = Deduplicator()
+    newest = DataFrame({'Id': ['A', 'B', 'A'], 'FullNm': ['a1', 'b', 'a2']})
+    oldest = DataFrame({'Id': ['C', 'A', 'B'], 'FullNm': ['c', 'a0', 'b0']})
+
+    assert obj.deduplicate(newest).to_dict('list') == {'Id': ['B', 'A'], 'FullNm': ['b', 'a2']}
+    assert obj.deduplicate(oldest).to_dict('list') == {'Id': ['C'], 'FullNm': ['c']}
+    assert len(obj) == 3
+
+
+def spill_to_disk_test():
+    spill_dir = mkdtemp()
+    obj = Deduplicator(max_memory_keys=10, spill_dir=spill_dir)
+
+    for start in range(0, 100, 20):
+        df = DataFrame({'Id': [f'XS{i:010d}' for i in range(start, start + 20)]})
+        assert len(obj.deduplicate(df)) == 20
+
+    assert len(obj._spilled) == 5
+    assert len(obj) == 100
+
+    df = DataFrame({'Id': [f'XS{i:010d}' for i in range(90, 110)]})
+    assert list(obj.deduplicate(df)['Id']) == [f'XS{i:010d}' for i in range(100, 110)]
+    obj.close()
+
+    assert not listdir(spill_dir)
+
+
+def method_dedup_test():
+    package = {'df': DataFrame({'Id': ['A', 'A', 'B']})}
+    package = Deduplicator().dedup(package)
+    assert list(package['df']['Id']) == ['A', 'B']
+    assert package['duplicates'] == 1
@@ -0,0 +1,165 @@
+import asyncio
+import pytest
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import urandom
+from pathlib import Path
+from tempfile import mkdtemp
+from threading import Thread
+
+import aiohttp
+import fsspec
+
+from app.Downloader import ASYNC_TRANSIENT_ERRORS, TRANSIENT_ERRORS, Downloader
+
+PAYLOAD = urandom(300 * 1024)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Serve PAYLOAD with byte ranges, dropping the connection halfway on the first `drops` GETs"""
+    drops = 0
+    ranges = []
+    accept_ranges = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.end_headers()
+
+    def do_GET(self):
+        start, end = 0, len(PAYLOAD) - 1
+        header = self.headers.get('Range')
+        type(self).ranges.append(header)
+
+        if header and type(self).accept_ranges:
+            first, last = header.replace('bytes=', '').split('-')
+            start, end = int(first), int(last) if last else end
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(PAYLOAD)}')
+        else:
+            self.send_response(200)
+
+        body = PAYLOAD[start:end + 1]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if type(self).drops > 0:
+            type(self).drops -= 1
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope='module')
+def server_url_var() -> str:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}/DLTINS_20210119_01of02.zip'.format(server.server_address[1])
+    server.shutdown()
+
+
+@pytest.fixture(scope='function')
+def flaky_handler(request):
+    FlakyHandler.drops = getattr(request, 'param', 0)
+    FlakyHandler.ranges = []
+    FlakyHandler.accept_ranges = True
+    yield FlakyHandler
+    FlakyHandler.accept_ranges = True
+
+
+@pytest.mark.parametrize('flaky_handler', (0, 1, 3), indirect=True)
+def method_download_resumes_test(server_url_var, flaky_handler):
+    obj = Downloader(download_dir=mkdtemp(), retries=1)
+    file_path = obj.download(server_url_var, checksum=md5(PAYLOAD).hexdigest())
+
+    assert file_path.read_bytes() == PAYLOAD
+    assert not list(file_path.parent.glob('*.part*'))
+    assert all(r.startswith('bytes=') for r in flaky_handler.ranges[1:])
+
+
+@pytest.mark.parametrize('flaky_handler', (100,), indirect=True)
+def method_download_ranges_ignored_retries_test(server_url_var, flaky_handler):
+    flaky_handler.accept_ranges = False
+    obj = Downloader(download_dir=mkdtemp(), retries=2)
+
+    with pytest.raises(TRANSIENT_ERRORS):
+        obj.download(server_url_var)
+
+    assert len(flaky_handler.ranges) == 4  # The first attempt moves forward, then each restart is a failure
+
+
+@pytest.mark.parametrize('flaky_handler', (0, 2), indirect=True)
+def method_download_parallel_parts_test(server_url_var, flaky_handler):
+    obj = Downloader(download_dir=mkdtemp(), parts=4, min_part_mb=0.05)
+    file_path = obj.download(server_url_var, checksum=md5(PAYLOAD).hexdigest())
+
+    assert file_path.read_bytes() == PAYLOAD
+    assert len(set(flaky_handler.ranges)) >= 4
+
+
+def method_download_checksum_mismatch_test(server_url_var, flaky_handler):
+    obj = Downloader(download_dir=mkdtemp())
+
+    with pytest.raises(ValueError):
+        obj.download(server_url_var, checksum='0' * 32)
+
+    assert not list(obj.download_dir.iterdir())
+
+
+def method_download_cached_test(server_url_var, flaky_handler):
+    obj = Downloader(download_dir=mkdtemp())
+    obj.download(server_url_var, checksum=md5(PAYLOAD).hexdigest())
+    obj.download(server_url_var, checksum=md5(PAYLOAD).hexdigest())
+
+    assert len(flaky_handler.ranges) == 1
+
+
+async def download_async(obj: Downloader, url: str) -> Path:
+    async with aiohttp.ClientSession() as http:
+        return await obj.download_async(http, url, checksum=md5(PAYLOAD).hexdigest())
+
+
+@pytest.mark.parametrize('flaky_handler', (0, 1, 3), indirect=True)
+def method_download_async_resumes_test(server_url_var, flaky_handler):
+    obj = Downloader(download_dir=mkdtemp(), retries=1)
+    file_path = asyncio.run(download_async(obj, server_url_var))
+
+    assert file_path.read_bytes() == PAYLOAD
+    assert not list(file_path.parent.glob('*.part*'))
+    assert all(r.startswith('bytes=') for r in flaky_handler.ranges[1:])
+
+
+@pytest.mark.parametrize('flaky_handler', (100,), indirect=True)
+def method_download_async_ranges_ignored_retries_test(server_url_var, flaky_handler):
+    flaky_handler.accept_ranges = False
+    obj = Downloader(download_dir=mkdtemp(), retries=2)
+
+    with pytest.raises(ASYNC_TRANSIENT_ERRORS):
+        asyncio.run(download_async(obj, server_url_var))
+
+    assert len(flaky_handler.ranges) <= 4
+
+
+@pytest.mark.parametrize('flaky_handler', (0, 2), indirect=True)
+def method_download_async_parallel_parts_test(server_url_var, flaky_handler):
+    obj = Downloader(download_dir=mkdtemp(), parts=4, min_part_mb=0.05)
+    file_path = asyncio.run(download_async(obj, server_url_var))
+
+    assert file_path.read_bytes() == PAYLOAD
+    assert len(set(flaky_handler.ranges)) >= 4
+
+
+def method_download_fsspec_url_test():
+    fsspec.filesystem('memory').pipe_file('/packages/DLTINS_20210119_01of02.zip', PAYLOAD)
+    obj = Downloader(download_dir=mkdtemp())
+    file_path = obj.download('memory://packages/DLTINS_20210119_01of02.zip', checksum=md5(PAYLOAD).hexdigest())
+
+    assert file_path.read_bytes() == PAYLOAD
+    assert file_path.name == 'DLTINS_20210119_01of02.zip'
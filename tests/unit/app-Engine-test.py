@@ -0,0 +1,62 @@
+import pytest
+from importlib.util import find_spec
+from io import BytesIO
+
+from pandas import read_parquet
+from pandas.core.frame import DataFrame
+
+from app.Engine import ENGINES, get_engine
+
+data_test = [
+    ('Lorem ipsum dolor', 'XS0000000001'),
+    ('Sed ut "perspiciatis", unde omnis iste natus error', 'XS0000000002'),
+    (None, 'XS0000000003'),
+    ('', 'XS0000000004'),
+]
+requirements = {'pandas': [], 'polars': ['polars'], 'duckdb': ['duckdb', 'pyarrow']}
+
+
+def df_sample() -> DataFrame:
+    return DataFrame(data_test, columns=['FullNm', 'Id'])
+
+
+@pytest.fixture(scope='module', params=list(ENGINES))
+def engine_object(request):
+    missing = [m for m in requirements[request.param] if find_spec(m) is None]
+    if missing:
+        pytest.skip(f'Optional dependency not installed: {missing}')
+
+    return get_engine(request.param)
+
+
+def engine_unknown_test():
+    with pytest.raises(ValueError):
+        get_engine('pytest')
+
+
+def method_create_derived_columns_test(engine_object):
+    frame = engine_object.create_derived_columns(engine_object.from_pandas(df_sample()))
+    assert engine_object.write(frame).decode().splitlines() == [
+        'FullNm,Id,a_count,contains_a',
+        'Lorem ipsum dolor,XS0000000001,0,NO',
+        '"Sed ut ""perspiciatis"", unde omnis iste natus error",XS0000000002,2,YES',
+        ',XS0000000003,0,NO',
+        ',XS0000000004,0,NO',
+    ]
+
+
+def method_write_same_as_pandas_test(engine_object):
+    pandas = get_engine('pandas')
+    expected = pandas.write(pandas.create_derived_columns(df_sample()))
+
+    frame = engine_object.create_derived_columns(engine_object.from_pandas(df_sample()))
+    assert engine_object.write(frame) == expected
+
+
+def method_write_parquet_test(engine_object):
+    if find_spec('pyarrow') is None:
+        pytest.skip('Optional dependency not installed: pyarrow')
+
+    frame = engine_object.create_derived_columns(engine_object.from_pandas(df_sample()))
+    df = read_parquet(BytesIO(engine_object.write(frame, 'parquet')))
+    assert list(df['a_count']) == [0, 2, 0, 0]
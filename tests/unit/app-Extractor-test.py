@@ -1,5 +1,16 @@
+import asyncio
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from tempfile import mkdtemp
+from threading import Thread
 from unittest.mock import patch, MagicMock
+from urllib.parse import parse_qs, urlparse
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import aiohttp
 
 from app.Extractor import Extractor
 
@@ -37,3 +48,208 @@ def method_fetch_package_url_test(extractor_object, source_xml_path_var, source_
         package_url = extractor_object.fetch_package_url(source_xml_url=source_xml_path_var, link_index=link_index)
         assert isinstance(package_url, str)
         assert package_url == expected_return
+
+
+@pytest.fixture(scope='module')
+def package_path_var() -> str:
+    return 'tests/samples/data.xml.zip'
+
+
+@pytest.fixture(scope='module')
+def expected_ids_var() -> list:
+    return ['AT0000A2B3D9', 'AT0000A2BJ35', 'DE000MC7YTA6'] * 2  # The sample ZIP has 2 equal XML members
+
+
+@pytest.mark.parametrize(
+    'parse_processes, shard_mb, expected_batches', (
+            (1, 16, 2),
+            (1, 0.001, 6),
+            (2, 16, 2),
+            (2, 0.001, 6),
+    ),
+)
+def method_iter_package_batches_test(package_path_var, expected_ids_var, parse_processes, shard_mb, expected_batches):
+    obj = Extractor(parse_processes=parse_processes, shard_mb=shard_mb)
+    batches = list(obj.iter_package_batches(package_path_var))
+    obj.close()
+
+    assert len(batches) == expected_batches
+    assert [i for batch in batches for i in batch['Id']] == expected_ids_var
+
+
+def method_parse_package_file_test(package_path_var, expected_ids_var):
+    df = Extractor().parse_package_file(package_path_var)
+    assert list(df['Id']) == expected_ids_var
+    assert df.iloc[2]['FullNm'] == 'Open End Turbo Long Hochtief emittiert von Morgan Stanley & Co. Int. plc'
+    assert df.iloc[2]['Issr'] == '4PQUHN3JPFGFNF3BB653'
+
+
+def method_split_xml_prefixed_namespace_test():
+    xml = (
+        b'<?xml version="1.0"?><a:Doc xmlns="urn:x" xmlns:a="urn:a"><a:Rpt>'
+        b'<a:FinInstrm><a:NewRcrd/></a:FinInstrm><a:FinInstrm><a:NewRcrd/></a:FinInstrm>'
+        b'</a:Rpt></a:Doc>'
+    )
+    shards = list(Extractor._split_xml(BytesIO(xml), shard_bytes=10, chunk_bytes=7))
+    assert shards == [
+        b'<Shard xmlns="urn:x" xmlns:a="urn:a"><a:FinInstrm><a:NewRcrd/></a:FinInstrm></Shard>',
+        b'<Shard xmlns="urn:x" xmlns:a="urn:a"><a:FinInstrm><a:NewRcrd/></a:FinInstrm></Shard>',
+    ]
+
+
+class SolrHandler(BaseHTTPRequestHandler):
+    """Serve 5 DLTINS docs, 2 per result page by the `start` param"""
+    requested = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        start = int(parse_qs(urlparse(self.path).query).get('start', ['0'])[0])
+        type(self).requested.append(start)
+        docs = ''.join(
+            '<doc><str name="download_link">https://x/DLTINS_2021011{}_01of01.zip</str>'
+            '<str name="file_type">DLTINS</str></doc>'.format(i)
+            for i in range(start, min(start + 2, 5))
+        )
+        body = f'<response><result name="response" numFound="5" start="{start}">{docs}</result></response>'.encode()
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope='module')
+def solr_url_var() -> str:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SolrHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    yield f'http://127.0.0.1:{port}/select?q=*&fq=publication_date:%5B2021%5D&rows=2&start=0'
+    server.shutdown()
+
+
+@pytest.fixture(scope='module')
+def expected_paged_urls_var() -> list:
+    return [f'https://x/DLTINS_2021011{i}_01of01.zip' for i in range(5)]
+
+
+def method_fetch_package_urls_pages_test(solr_url_var, expected_paged_urls_var):
+    SolrHandler.requested = []
+    assert Extractor().fetch_package_urls(source_xml_url=solr_url_var) == expected_paged_urls_var
+    assert SolrHandler.requested == [0, 2, 4]
+
+
+@pytest.mark.parametrize('link_index, expected_requested', ((1, [0]), (2, [0, 2]), (9, [0, 2, 4])))
+def method_fetch_package_url_pages_test(solr_url_var, expected_paged_urls_var, link_index, expected_requested):
+    SolrHandler.requested = []
+    package_url = Extractor().fetch_package_url(source_xml_url=solr_url_var, link_index=link_index)
+
+    assert package_url == (expected_paged_urls_var[link_index] if link_index < 5 else None)
+    assert SolrHandler.requested == expected_requested
+
+
+def method_fetch_package_urls_async_pages_test(solr_url_var, expected_paged_urls_var):
+    async def fetch():
+        async with aiohttp.ClientSession() as http:
+            return await Extractor().fetch_package_urls_async(http, source_xml_url=solr_url_var)
+
+    SolrHandler.requested = []
+    assert asyncio.run(fetch()) == expected_paged_urls_var
+    assert sorted(SolrHandler.requested) == [0, 2, 4]
+
+
+@pytest.mark.parametrize('min_urls, expected_requested', ((2, [0]), (3, [0, 2]), (10, [0, 2, 4])))
+def method_fetch_package_urls_async_min_urls_test(solr_url_var, expected_paged_urls_var, min_urls, expected_requested):
+    async def fetch():
+        async with aiohttp.ClientSession() as http:
+            return await Extractor().fetch_package_urls_async(http, source_xml_url=solr_url_var, min_urls=min_urls)
+
+    SolrHandler.requested = []
+    assert asyncio.run(fetch()) == expected_paged_urls_var[:len(expected_requested) * 2]
+    assert SolrHandler.requested == expected_requested
+
+
+@pytest.fixture(scope='module')
+def package_xml_var(package_path_var) -> bytes:
+    with ZipFile(package_path_var) as z:
+        return z.read(z.infolist()[0])
+
+
+@pytest.mark.parametrize('shard_bytes', (1, 700, 1024 * 1024))
+def method_split_mapped_xml_test(package_xml_var, shard_bytes):
+    padded = b'PADDING' + package_xml_var + b'<FinInstrm>not in the document</FinInstrm>'
+    end = len(padded) - len(b'<FinInstrm>not in the document</FinInstrm>')
+    shards = [
+        open_tag + padded[start:stop] + b'</Shard>'
+        for start, stop, open_tag in Extractor._split_mapped_xml(padded, 7, end, shard_bytes)
+    ]
+    assert shards == list(Extractor._split_xml(BytesIO(package_xml_var), shard_bytes, chunk_bytes=512))
+
+
+@pytest.mark.parametrize('compression', (ZIP_STORED, ZIP_DEFLATED, None))
+@pytest.mark.parametrize('parse_processes', (1, 2))
+def method_iter_package_batches_local_test(package_xml_var, expected_ids_var, compression, parse_processes):
+    file_path = Path(mkdtemp()) / 'DLTINS_20210119_01of02.zip'
+
+    if compression is None:
+        file_path.write_bytes(package_xml_var)
+        expected_ids_var = expected_ids_var[:3]
+    else:
+        with ZipFile(file_path, 'w', compression=compression) as z:
+            z.writestr('a.xml', package_xml_var)
+            z.writestr('b.xml', package_xml_var)
+
+    obj = Extractor(parse_processes=parse_processes, shard_mb=0.001)
+    batches = list(obj.iter_package_batches(file_path))
+    obj.close()
+
+    assert [i for batch in batches for i in batch['Id']] == expected_ids_var
+
+
+def method_iter_package_batches_in_process_test(package_xml_var, expected_ids_var):
+    file_path = Path(mkdtemp()) / 'DLTINS_20210119_01of02.zip'
+    with ZipFile(file_path, 'w', compression=ZIP_STORED) as z:
+        z.writestr('a.xml', package_xml_var)
+        z.writestr('b.xml', package_xml_var)
+
+    with patch('app.Extractor._parse_mapped_shard') as reopened:
+        batches = list(Extractor(shard_mb=0.001).iter_package_batches(file_path))
+
+    reopened.assert_not_called()
+    assert [i for batch in batches for i in batch['Id']] == expected_ids_var
+
+
+@pytest.mark.parametrize(
+    'package_url, expected', (
+            ('/tmp/DLTINS_20210119_01of02.zip', Path('/tmp/DLTINS_20210119_01of02.zip')),
+            ('file:///tmp/My%20Files/DLTINS_20210119_01of02.zip', Path('/tmp/My Files/DLTINS_20210119_01of02.zip')),
+            ('data/DLTINS_20210119_01of02.zip', Path('data/DLTINS_20210119_01of02.zip')),
+            ('https://firds.esma.europa.eu/firds/DLTINS_20210119_01of02.zip', None),
+            ('s3://bucket/DLTINS_20210119_01of02.zip', None),
+    ),
+)
+def method_local_path_test(package_url, expected):
+    assert Extractor.local_path(package_url) == expected
+
+
+def method_parse_local_package_kept_test(package_path_var, expected_ids_var):
+    obj = Extractor()
+    package = obj.parse(obj.download({'url': f'file://{Path(package_path_var).resolve()}'}))
+
+    assert list(package['df']['Id']) == expected_ids_var
+    assert Path(package_path_var).is_file()
+
+
+def method_iter_package_batches_threads_test(package_path_var, expected_ids_var):
+    obj = Extractor(parse_processes=2)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(
+            lambda _: [i for batch in obj.iter_package_batches(package_path_var) for i in batch['Id']], range(2),
+        ))
+    pool = obj._get_pool()
+    obj.close()
+
+    assert results == [expected_ids_var, expected_ids_var]
+    assert pool._mp_context.get_start_method() == 'spawn'
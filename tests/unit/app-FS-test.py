@@ -0,0 +1,100 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from os import chmod
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest.mock import MagicMock, patch
+
+from app.FS import FS
+
+
+@pytest.fixture(scope='function')
+def state_file_var() -> str:
+    return f'{mkdtemp()}/fs-state.json'
+
+
+@pytest.fixture(scope='function')
+def local_dir_var() -> str:
+    return f'{mkdtemp()}/pytest'
+
+
+def pooled_connection_test(local_dir_var):
+    fs = FS().connect(local_dir=local_dir_var)
+    assert fs is FS().connect(local_dir=local_dir_var)
+
+
+def validation_cached_in_process_test(local_dir_var):
+    obj = FS(validation_ttl=60)
+    obj.connect(local_dir=local_dir_var)
+
+    with patch.object(FS, '_validate_fs_location') as mock:
+        obj.connect(local_dir=local_dir_var)
+        mock.assert_not_called()
+
+
+def validation_cached_in_state_file_test(local_dir_var, state_file_var):
+    FS(validation_ttl=60, state_file=state_file_var).connect(local_dir=local_dir_var)
+    FS._validated.clear()
+
+    with patch.object(FS, '_validate_fs_location') as mock:
+        FS(validation_ttl=60, state_file=state_file_var).connect(local_dir=local_dir_var)
+        mock.assert_not_called()
+
+
+def validation_expired_test(local_dir_var, state_file_var):
+    FS(validation_ttl=-1, state_file=state_file_var).connect(local_dir=local_dir_var)
+
+    with patch.object(FS, '_validate_fs_location') as mock:
+        FS(validation_ttl=60, state_file=state_file_var).connect(local_dir=local_dir_var)
+        mock.assert_called_once()
+
+
+def method_invalidate_test(local_dir_var, state_file_var):
+    obj = FS(validation_ttl=60, state_file=state_file_var)
+    fs = obj.connect(local_dir=local_dir_var)
+    obj.invalidate(fs, location=local_dir_var)
+
+    with patch.object(FS, '_validate_fs_location') as mock:
+        assert obj.connect(local_dir=local_dir_var) is not fs
+        mock.assert_called_once()
+
+
+@pytest.mark.parametrize('mode, error', ((0o600, None), (0o644, PermissionError)))
+def protected_file_pooled_test(mode, error):
+    secret_file = f'{mkdtemp()}/aws-key'
+    with open(secret_file, 'w') as f:
+        f.write('pytest-aws-secret-string')
+
+    chmod(secret_file, mode)
+
+    attrs = {'aws_bucket': 'pytest', 'aws_secret_file': secret_file, 'aws_key': 'pytest'}
+    with patch.object(FS, '_validate_fs_location'):
+        if error:
+            with pytest.raises(error):
+                FS().connect(**attrs)
+            return
+
+        fs = FS().connect(**attrs)
+        with patch.object(FS, '_fetch_from_protected_file') as mock:
+            assert FS().connect(**attrs) is fs
+            mock.assert_not_called()
+
+
+def method_save_state_concurrent_test(state_file_var):
+    obj = FS(validation_ttl=60, state_file=state_file_var)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda i: obj._save_state({f'local:None:{i}': 1.0}), range(64)))
+
+    assert len(obj._load_state()) == 1
+    assert [path.name for path in Path(state_file_var).parent.iterdir()] == ['fs-state.json']
+
+
+def method_save_state_failed_test(local_dir_var):
+    blocker = f'{mkdtemp()}/file'
+    open(blocker, 'w').close()
+    log = MagicMock()
+
+    FS(validation_ttl=60, state_file=f'{blocker}/fs-state.json', log=log).connect(local_dir=local_dir_var)
+
+    log.warning.assert_called_once()
@@ -0,0 +1,71 @@
+import pytest
+from tempfile import mkdtemp
+
+import numpy as np
+from fsspec.implementations.local import LocalFileSystem
+from pandas.core.frame import DataFrame
+
+from app.Index import Index
+from app.Storage import Storage
+
+
+@pytest.mark.parametrize(
+    'data, expected', (
+            (b'', []),
+            (b'Id\n', [3]),
+            (b'Id,FullNm\nA,x\nB,y', [10, 14, 17]),
+            (b'Id,FullNm\nA,"x\ny"\nB,"say ""hi""\n"\n', [10, 18, 34]),
+    ),
+)
+def method_csv_row_ends_test(data, expected):
+    assert list(Index.csv_row_ends(data)) == expected
+    assert list(Index.csv_row_ends(data, chunk_bytes=4)) == expected
+
+
+def method_find_test():
+    ids = [f'XS{i:010d}' for i in range(1000)] + ['XS0000000007']
+    data = ('Id\n' + ''.join(f'{i}\n' for i in ids)).encode()
+    file_path = f'{mkdtemp()}/data.csv.idx'
+    fs = LocalFileSystem()
+    fs.pipe_file(file_path, Index.build(ids, data, 'csv'))
+
+    index = Index(fs, file_path)
+    records = index.find(Index.hash(['XS0000000007', 'XS0000000999', 'missing']))
+
+    assert index.header_length == 3
+    assert [data[o:o + n] for o, n in records[['offset', 'length']]] == [
+        b'XS0000000007\n', b'XS0000000999\n', b'XS0000000007\n',
+    ]
+    assert not len(index.find(Index.hash(['missing'])))
+
+
+def method_build_rows_mismatch_test():
+    with pytest.raises(ValueError):
+        Index.build(['A', 'B'], b'Id\nA\n', 'csv')
+
+
+@pytest.mark.parametrize('output_format', ('csv', 'parquet'))
+def storage_lookup_test(output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+
+    storage = Storage(local_dir=mkdtemp(), output_format=output_format)
+    for i in range(2):
+        df = DataFrame({'Id': [f'ID{j:05d}' for j in range(i, 600, 2)], 'FullNm': ['a,\n"b"'] * 300})
+        package = storage.serialize({'df': df, 'filename': f'data.{i}.{output_format}'})
+        storage.upload(package)
+
+    df = storage.lookup(['ID00001', 'ID00598', 'missing'])
+
+    assert list(df['Id']) == ['ID00598', 'ID00001']
+    assert list(df['FullNm']) == ['a,\n"b"'] * 2
+    assert [path.rsplit('/', 1)[1] for path in df['file']] == [f'data.0.{output_format}', f'data.1.{output_format}']
+    assert np.array_equal(storage.lookup(['missing']).shape, (0, 0))
+
+
+def storage_lookup_csv_text_test():
+    storage = Storage(local_dir=mkdtemp())
+    df = DataFrame({'Id': ['ID1', 'ID2'], 'CmmdtyDerivInd': ['false', 'true'], 'Issr': ['NA', '007'], 'FullNm': ['', 'x']})
+    storage.upload(storage.serialize({'df': df, 'filename': 'data.0.csv'}))
+
+    assert storage.lookup(['ID1', 'ID2']).drop(columns='file').to_dict('records') == df.to_dict('records')
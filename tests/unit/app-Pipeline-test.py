@@ -0,0 +1,154 @@
+import pytest
+from threading import Lock
+from time import sleep
+
+from pandas.core.frame import DataFrame
+
+from app.Pipeline import Pipeline, Stage
+
+
+def method_run_test():
+    pipeline = Pipeline([Stage('double', lambda x: x * 2, workers=3), Stage('add', lambda x: x + 1, workers=2)])
+    assert sorted(pipeline.run(range(10))) == [x * 2 + 1 for x in range(10)]
+    assert pipeline.metrics['double']['processed'] == 10
+    assert pipeline.metrics['add']['processed'] == 10
+
+
+def failed_items_dropped_test():
+    def fail_on_odd(x):
+        if x % 2:
+            raise ValueError(x)
+        return x
+
+    pipeline = Pipeline([Stage('even', fail_on_odd), Stage('same', lambda x: x)])
+    assert sorted(pipeline.run(range(6))) == [0, 2, 4]
+    assert pipeline.metrics['even']['failed'] == 3
+    assert [e[1] for e in pipeline.errors] == [1, 3, 5]
+
+
+def generator_and_none_outputs_test():
+    def split(x):
+        yield from range(x)
+
+    pipeline = Pipeline([Stage('split', split), Stage('drop_zero', lambda x: x or None)])
+    assert sorted(pipeline.run([1, 3])) == [1, 2]
+
+
+def ordered_stage_test():
+    def unordered(x):
+        sleep(0.001 * (10 - x))
+        if x == 3:
+            return None
+        if x == 5:
+            raise ValueError(x)
+        return x
+
+    handled = []
+    pipeline = Pipeline([
+        Stage('unordered', unordered, workers=4, queue_size=10),
+        Stage('ordered', handled.append, ordered=True),
+    ])
+    pipeline.run(range(10))
+    assert handled == [0, 1, 2, 4, 6, 7, 8, 9]
+
+
+def backpressure_test():
+    fed = []
+
+    def items():
+        for i in range(20):
+            fed.append(i)
+            yield i
+
+    def slow(x):
+        sleep(0.05)
+        return len(fed) - x
+
+    pipeline = Pipeline([Stage('fast', lambda x: x, queue_size=1), Stage('slow', slow, queue_size=1)])
+    assert max(pipeline.run(items())) <= 5  # In the queues (2), in the workers (2), and at the feeder (1)
+    assert pipeline.metrics['slow']['max_queued'] == 1
+
+
+def memory_budget_test():
+    queued = []
+    lock = Lock()
+
+    def produce(x):
+        with lock:
+            queued.append(1)
+        return b'x' * 1024 * 1024
+
+    def consume(data):
+        with lock:
+            in_flight = len(queued)
+            queued.pop()
+        sleep(0.02)
+        return in_flight
+
+    pipeline = Pipeline(
+        [Stage('produce', produce, queue_size=10), Stage('consume', consume, queue_size=10)], memory_budget_mb=2,
+    )
+    assert max(pipeline.run(range(8))) <= 3
+
+
+def ordered_memory_budget_test():
+    produced = []
+
+    def produce(x):
+        if x == 0:
+            sleep(0.2)  # Every later item waits for this one in the ordered stage
+        produced.append(x)
+        return {'x': x, 'data': b'x' * 1024 * 1024}
+
+    def consume(item):
+        return item['x'], len(produced)
+
+    pipeline = Pipeline(
+        [Stage('produce', produce, workers=4, queue_size=2), Stage('consume', consume, queue_size=2, ordered=True)],
+        memory_budget_mb=3,
+    )
+    results = pipeline.run(range(20))
+
+    assert [x for x, _ in results] == list(range(20))
+    assert results[0][1] <= 10  # Held back until the budget is used up (3), then fed before that (queue 2, workers 4)
+
+
+@pytest.mark.parametrize('ordered', (False, True))
+def memory_budget_after_ordered_stage_test(ordered):
+    peaks = []
+
+    def slow(item):
+        peaks.append((pipeline._queued_bytes - pipeline._held_bytes, pipeline._queued_bytes))
+        sleep(0.005)
+        return item['x']
+
+    stages = [Stage('make', lambda x: {'x': x, 'data': bytes(500)}, workers=4, queue_size=2)]
+    if ordered:
+        stages.append(Stage('pass', lambda item: item, queue_size=2, ordered=True))
+    stages.append(Stage('slow', slow, queue_size=20))
+
+    pipeline = Pipeline(stages, memory_budget_mb=2500 / 1024 / 1024)
+    assert sorted(pipeline.run(range(40))) == list(range(40))
+    assert max(queued for queued, _ in peaks) <= 2500  # Queued for the stages, the slow one included
+    assert max(total for _, total in peaks) <= 5000  # And held back, until the budget is used up
+
+
+@pytest.mark.parametrize(
+    'item, expected', (
+            (b'1234', 4),
+            ({'a': b'12', 'b': None, 'c': bytearray(3)}, 5),
+            ('not counted', 0),
+    ),
+)
+def method_sizeof_test(item, expected):
+    assert Pipeline.sizeof(item) == expected
+
+
+def method_sizeof_dataframe_test():
+    assert Pipeline.sizeof({'df': DataFrame({'a': ['x' * 100] * 10})}) > 1000
+
+
+@pytest.mark.parametrize('module, frame', (('polars', 'DataFrame'), ('pyarrow', 'table')))
+def method_sizeof_engine_frame_test(module, frame):
+    module = pytest.importorskip(module)
+    assert Pipeline.sizeof({'df': getattr(module, frame)({'a': ['x' * 100] * 10})}) >= 1000
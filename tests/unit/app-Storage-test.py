@@ -1,5 +1,7 @@
+import asyncio
 import pytest
 from tempfile import gettempdir, mkdtemp
+from unittest.mock import MagicMock
 
 from pandas.core.frame import DataFrame
 
@@ -47,3 +49,62 @@ def store_data_in_local_csv_test(work_dir_var):
     df = DataFrame([1, 2, 3], columns=['FullNm'])
     obj = Storage(local_dir=work_dir_var)
     obj.store_csv(df, 'pytest.csv')
+
+
+def method_upload_async_test():
+    storage = Storage(local_dir=mkdtemp(), concurrency=2)
+    packages = [
+        storage.serialize({'df': DataFrame({'Id': [f'ID{i}'], 'FullNm': ['x']}), 'filename': f'data.{i}.csv'})
+        for i in range(4)
+    ]
+
+    async def upload():
+        return await asyncio.gather(*(storage.upload_async(package) for package in packages))
+
+    stored = asyncio.run(upload())
+    fs, location = storage.file_systems[0]
+
+    assert [package['stored'] for package in stored] == [[f'{location}/data.{i}.csv'] for i in range(4)]
+    assert fs.cat_file(f'{location}/data.3.csv') == b'Id,FullNm\nID3,x\n'
+    assert list(storage.lookup(['ID2'])['Id']) == ['ID2']
+
+
+def method_upload_reconnects_test():
+    storage = Storage(local_dir=mkdtemp())
+    fs, location = storage.file_systems[0]
+    broken = MagicMock(protocol='file')
+    broken.open.side_effect = OSError('Connection reset')
+    storage.file_systems[0] = (broken, location)
+    package = {'df': DataFrame({'Id': ['ID1'], 'FullNm': ['x']}), 'filename': 'data.1.csv'}
+
+    assert storage.upload(storage.serialize(dict(package)))['stored'] == [f'{location}/data.1.csv']
+    assert storage.file_systems[0] == (fs, location)
+
+
+def method_upload_async_reconnects_test():
+    storage = Storage(local_dir=mkdtemp())
+    fs, location = storage.file_systems[0]
+    broken = MagicMock(protocol='file')
+    broken.pipe_file.side_effect = OSError('Connection reset')
+    storage.file_systems[0] = (broken, location)
+    package = {'df': DataFrame({'Id': ['ID1'], 'FullNm': ['x']}), 'filename': 'data.1.csv'}
+
+    assert asyncio.run(storage.upload_async(storage.serialize(package)))['stored'] == [f'{location}/data.1.csv']
+    assert storage.file_systems[0] == (fs, location)
+
+
+def method_upload_reconnect_failure_test():
+    log = MagicMock()
+    storage = Storage(local_dir=mkdtemp(), log=log)
+    _, location = storage.file_systems[0]
+    broken = MagicMock(protocol='file')
+    broken.open.side_effect = OSError('Connection reset')
+    storage.file_systems[0] = (broken, location)
+    storage._connections[0] = {'local_dir': None}
+    package = {'df': DataFrame({'Id': ['ID1'], 'FullNm': ['x']}), 'filename': 'data.1.csv'}
+
+    with pytest.raises(OSError, match='Connection reset'):
+        storage.upload(storage.serialize(package))
+
+    assert storage.file_systems[0] == (broken, location)
+    log.error.assert_called_once_with(f'Could not reconnect to the storage {location}. See logs for details.')